@@ -0,0 +1,58 @@
+"""
+    Starting and retargeting transitions and one fader tick, which steps the ramps and writes them through
+    the write coalescer, with a transition per session
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_fader [count ...]
+"""
+import sys
+
+from benchmarks import synthetic
+from benchmarks.timing import best_time, repeats
+from modules.fader.fader import Fader
+from modules.volumecache.volumecache import VolumeCache, WriteCoalescer
+
+
+def run(count):
+    """
+    :param count: number of concurrent transitions
+    :return: dict of case -> best time in seconds
+    """
+    audio_sessions = synthetic.sessions(count)
+    repeat = repeats(count)
+
+    def start(fader):
+        for index, audio_session in enumerate(audio_sessions):
+            fader.fade(index, audio_session, 1, .2, 30)
+
+    def started():
+        # never started, so the ramps stay where they are
+        fader = Fader(lambda batch: None)
+        start(fader)
+        return fader
+
+    def retarget(fader):
+        for index, audio_session in enumerate(audio_sessions):
+            fader.fade(index, audio_session, 1, .5, 30)
+
+    def ticking():
+        # manual, so the steps only run when timed
+        write_coalescer = WriteCoalescer(VolumeCache(), lambda batch: None, lambda session: session.Process.id)
+        fader = Fader(write_coalescer.write, manual=True)
+        fader.start()
+        start(fader)
+        return fader
+
+    def tick(fader):
+        fader.advance(fader.interval)
+
+    return {
+        'fade_start': best_time(start, repeat, setup=lambda: Fader(lambda batch: None)),
+        'fade_retarget': best_time(retarget, repeat, setup=started),
+        'tick': best_time(tick, repeat, setup=ticking),
+    }
+
+
+if __name__ == '__main__':
+    for count in [int(count) for count in sys.argv[1:]] or [10, 100, 1000, 5000]:
+        print(count, {case: f"{seconds*1000:.3f} ms" for case, seconds in run(count).items()})
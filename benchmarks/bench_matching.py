@@ -0,0 +1,68 @@
+"""
+    Taking over an enumeration of the sessions and matching them against the profile entries, in full
+    and for a single changed session, plus the lookups of the microphone profiles
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_matching [count ...]
+"""
+import shutil
+import sys
+import tempfile
+
+from benchmarks import synthetic
+from benchmarks.bench_profiles import load_config
+from benchmarks.timing import best_time, repeats
+from modules.audiosessions.audiosession import AudioSession
+from modules.audiosessions.sessiontable import SessionTable
+from modules.profiles.profilecompiler import ProfileCompiler
+
+
+def run(count):
+    """
+    :param count: number of sessions and controlled applications
+    :return: dict of case -> best time in seconds
+    """
+    directory = tempfile.mkdtemp(prefix='audiomanager-bench-')
+    try:
+        table = ProfileCompiler(*synthetic.write_profiles(directory, count)).compile()
+    finally:
+        shutil.rmtree(directory)
+    matcher, rule_engine = load_config(table)
+    audio_sessions = synthetic.sessions(count)
+    repeat = repeats(count)
+
+    def index_all(enumeration):
+        matcher.index(SessionTable().update(enumeration).added)
+
+    session_table = SessionTable()
+    session_table.update(audio_sessions)
+    session_index = matcher.index(session_table.records.values())
+    changed = audio_sessions[0]
+
+    def update_one():
+        # a new enumeration where one session was muted or unmuted
+        current = list(audio_sessions)
+        current[0] = AudioSession(name=changed.name, process=changed.name, process_id=changed.Process.id,
+                                  state=not session_table.records[changed.Process.id].state, current_volume=1)
+        session_index.update(session_table.update(current))
+
+    def match_processes():
+        for pattern in table.mic_profiles:
+            session_index.get(pattern)
+
+    def evaluate_rules():
+        # every watched application changes its state, so all targets are resolved again
+        rule_engine.update(session_index, lambda session: session.Process.id, lambda session: bool(session.State),
+                           'headset' if rule_engine.device != 'headset' else 'speaker', False)
+
+    return {
+        'index_all': best_time(index_all, max(3, repeat // 4), setup=lambda: synthetic.sessions(count)),
+        'update_one': best_time(update_one, repeat),
+        'match_processes': best_time(match_processes, repeat),
+        'evaluate_rules': best_time(evaluate_rules, repeat),
+    }
+
+
+if __name__ == '__main__':
+    for count in [int(count) for count in sys.argv[1:]] or [10, 100, 1000, 5000]:
+        print(count, {case: f"{seconds*1000:.3f} ms" for case, seconds in run(count).items()})
@@ -0,0 +1,60 @@
+"""
+    Parse throughput of the pactl sink-input parsers on the recorded corpus, scaled up to thousands of sink-inputs
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_pactl_parser [count ...]
+"""
+import json
+import os
+import sys
+
+from benchmarks.timing import best_time, repeats
+from modules.pulseaudio.pactlparser import parse_sink_inputs_json, parse_sink_inputs_text
+
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'corpus')
+
+
+def load_corpus(count):
+    """
+    repeats the recorded sink-inputs with new indices until there are count of them
+    :param count: number of sink-inputs
+    :return: (text output, json output)
+    """
+    with open(os.path.join(CORPUS_DIRECTORY, 'pactl_list_sink_inputs.txt'), encoding='utf-8') as file:
+        blocks = [block for block in file.read().split('Sink Input #') if block]
+    with open(os.path.join(CORPUS_DIRECTORY, 'pactl_list_sink_inputs.json'), encoding='utf-8') as file:
+        records = json.load(file)
+
+    text_blocks = []
+    json_records = []
+    for index in range(count):
+        block = blocks[index % len(blocks)]
+        text_blocks.append(f"Sink Input #{index}" + block[block.index('\n'):])
+        json_records.append(dict(records[index % len(records)], index=index))
+    return ''.join(text_blocks), json.dumps(json_records)
+
+
+def run(count):
+    """
+    :param count: number of sink-inputs
+    :return: dict of case -> best time in seconds
+    """
+    text_output, json_output = load_corpus(count)
+    repeat = repeats(count)
+    return {
+        'parse_text': best_time(lambda: parse_sink_inputs_text(text_output), repeat),
+        'parse_json': best_time(lambda: parse_sink_inputs_json(json_output), repeat),
+    }
+
+
+def main(counts):
+    print(f"{'sink-inputs':>12} {'text ms':>10} {'json ms':>10} {'text/s':>12} {'json/s':>12}")
+    for count in counts:
+        times = run(count)
+        text_time, json_time = times['parse_text'], times['parse_json']
+        print(f"{count:>12} {text_time*1000:>10.2f} {json_time*1000:>10.2f} "
+              f"{count/text_time:>12.0f} {count/json_time:>12.0f}")
+
+
+if __name__ == '__main__':
+    main([int(count) for count in sys.argv[1:]] or [10, 100, 1000, 5000])
@@ -0,0 +1,60 @@
+"""
+    Compiling the config and profile files and building the matcher and rule engine from them, as done on
+    every change of the files, for synthetic profiles with thousands of rules
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_profiles [count ...]
+"""
+import shutil
+import sys
+import tempfile
+
+from benchmarks import synthetic
+from benchmarks.timing import best_time, repeats
+from modules.audiosessions.sessionmatcher import SessionMatcher
+from modules.profiles.profilecompiler import ProfileCompiler, thaw
+from modules.rules.ruleengine import RuleEngine
+
+
+def load_config(table):
+    """
+    builds what the control loop builds from a new profile table
+    """
+    patterns = set(table.mic_profiles)
+    for application, profile_applications in table.volume_profiles.items():
+        patterns.add(application)
+        patterns.update(profile_applications)
+    return SessionMatcher(patterns), RuleEngine(table)
+
+
+def run(count):
+    """
+    :param count: number of controlled applications
+    :return: dict of case -> best time in seconds
+    """
+    directory = tempfile.mkdtemp(prefix='audiomanager-bench-')
+    try:
+        compiler = ProfileCompiler(*synthetic.write_profiles(directory, count))
+        # reading the files dominates, so fewer runs
+        repeat = max(3, repeats(count, 200))
+        table = compiler.compile()
+        # the way update_config changes a setting
+        config = thaw(table.config)
+        config['profiles']['group0'] = False
+        toggled = table.replace_config(config)
+
+        def adopt(rule_engine):
+            rule_engine.adopt(toggled)
+
+        return {
+            'compile': best_time(compiler.compile, repeat),
+            'load_config': best_time(lambda: load_config(table), repeat),
+            'toggle_group': best_time(adopt, repeat, setup=lambda: RuleEngine(table)),
+        }
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    for count in [int(count) for count in sys.argv[1:]] or [10, 100, 1000, 5000]:
+        print(count, {case: f"{seconds*1000:.3f} ms" for case, seconds in run(count).items()})
@@ -0,0 +1,41 @@
+"""
+    Full iterations of the control loop, from the delivery of changed sessions to waiting for the next
+    change, against synthetic sessions on a virtual clock and synthetic profiles
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_tick [count ...]
+"""
+import logging
+import shutil
+import statistics
+import sys
+import tempfile
+
+from benchmarks import synthetic
+from modules.backends.simulatedbackend import SimulatedBackend
+
+
+def run(count, duration=10):
+    """
+    :param count: number of sessions and controlled applications
+    :param duration: virtual seconds to simulate
+    :return: dict of case -> median time in seconds, single iterations are too short to take the best one
+    """
+    from main import AudioManager
+    logging.getLogger("audiomanager").setLevel(logging.WARNING)
+    directory = tempfile.mkdtemp(prefix='audiomanager-bench-')
+    try:
+        config_path, profiles_path = synthetic.write_profiles(directory, count)
+        backend = SimulatedBackend(count, duration=duration)
+        app = AudioManager(backend=backend, tray=False, config_path=config_path, profiles_path=profiles_path,
+                           journal_path=None, checkpoint_path=None)
+        backend.finished.wait()
+        app.stop()
+    finally:
+        shutil.rmtree(directory)
+    return {'tick': statistics.median(backend.latencies)}
+
+
+if __name__ == '__main__':
+    for count in [int(count) for count in sys.argv[1:]] or [10, 100, 1000, 5000]:
+        print(count, {case: f"{seconds*1000:.3f} ms" for case, seconds in run(count).items()})
@@ -0,0 +1,104 @@
+"""
+    Runs all benchmarks from 10 to 5000 sessions and rules and compares them with the stored baseline
+
+    A case regresses when it takes more than the threshold longer than in the baseline (and at least
+    min_delta seconds longer, so the shortest cases don't fail on timer noise). The exit code is 1 if
+    any case regressed, so the suite can gate changes. Baselines are only comparable on the same machine.
+
+    Usage (from the repository root):
+        python -m benchmarks.suite                  compares with benchmarks/baseline.json
+        python -m benchmarks.suite --save           runs and stores the results as the new baseline
+        python -m benchmarks.suite --threshold 0.5  allows 50% instead of 25%
+        python -m benchmarks.suite --only matching --counts 10 1000
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+
+from benchmarks import bench_fader, bench_matching, bench_pactl_parser, bench_profiles, bench_tick
+
+BENCHMARKS = {
+    'pactl_parser': bench_pactl_parser.run,
+    'profiles': bench_profiles.run,
+    'matching': bench_matching.run,
+    'fader': bench_fader.run,
+    'tick': bench_tick.run,
+}
+COUNTS = [10, 100, 1000, 5000]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baseline.json')
+
+
+def run(names, counts):
+    """
+    :param names: benchmarks to run
+    :param counts: numbers of sessions and rules
+    :return: dict of "<benchmark>.<case>/<count>" -> seconds
+    """
+    results = {}
+    for name in names:
+        for count in counts:
+            for case, seconds in BENCHMARKS[name](count).items():
+                results[f"{name}.{case}/{count}"] = seconds
+                print(f"{name}.{case}/{count}: {seconds*1000:.3f} ms", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    """
+    :param results: dict of case -> seconds
+    :param baseline: dict of case -> seconds
+    :param threshold: allowed slowdown as a fraction of the baseline
+    :param min_delta: slowdowns below this many seconds are never regressions
+    :return: list of (case, baseline seconds, seconds) of the regressed cases
+    """
+    return [(case, baseline[case], seconds) for case, seconds in results.items()
+            if case in baseline and seconds > baseline[case] * (1 + threshold) and seconds - baseline[case] > min_delta]
+
+
+def machine():
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the control loop with a regression gate")
+    parser.add_argument('--save', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline file")
+    parser.add_argument('--threshold', type=float, default=.25, help="allowed slowdown, 0.25 is 25%%")
+    parser.add_argument('--min-delta', type=float, default=.00002, help="seconds a case may always get slower")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--counts', nargs='+', type=int, default=COUNTS)
+    arguments = parser.parse_args()
+
+    results = run(arguments.only, arguments.counts)
+    if arguments.save:
+        baseline = {'machine': machine(), 'results': {}}
+        if os.path.exists(arguments.baseline):
+            with open(arguments.baseline, encoding='utf-8') as file:
+                baseline['results'] = json.load(file)['results']
+        baseline['results'].update(results)
+        with open(arguments.baseline, 'w', encoding='utf-8') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+        print(f"Saved {len(results)} results to {arguments.baseline}")
+        return 0
+
+    if not os.path.exists(arguments.baseline):
+        print(f"No baseline at {arguments.baseline}, create one with --save")
+        return 1
+    with open(arguments.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    if baseline['machine'] != machine():
+        print(f"Warning: the baseline was measured on {baseline['machine']}, not {machine()}")
+    regressions = compare(results, baseline['results'], arguments.threshold, arguments.min_delta)
+    for case, before, after in regressions:
+        print(f"Regression {case}: {before*1000:.3f} ms -> {after*1000:.3f} ms ({after/before - 1:+.0%})")
+    missing = [case for case in results if case not in baseline['results']]
+    if missing:
+        print(f"{len(missing)} cases are not in the baseline: {', '.join(missing)}")
+    print(f"{len(regressions)} of {len(results)} cases regressed more than {arguments.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
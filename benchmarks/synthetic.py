@@ -0,0 +1,85 @@
+"""
+    Synthetic config, profiles and sessions for the benchmarks, scaled by the number of rules and sessions
+"""
+import os
+
+import yaml
+
+from modules.audiosessions.audiosession import AudioSession
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+# members per group file
+GROUP_SIZE = 10
+
+
+def application(index):
+    # fixed width, so no name is part of another one
+    return f"app{index:05d}"
+
+
+def member(index):
+    return f"member{index:05d}"
+
+
+def write_profiles(directory, count):
+    """
+    writes config/config.yaml and profiles/ with count controlled applications, each watching a group,
+    another application and hear through, some entries use the exact, glob and re match modes
+    :param directory: empty directory
+    :param count: number of controlled applications and group members
+    :return: (config path, profiles path)
+    """
+    with open(os.path.join(REPOSITORY, 'config', 'config.yaml.example'), encoding='utf-8') as file:
+        config = yaml.load(file, yaml.SafeLoader)
+    # no webhooks or ports in benchmarks
+    config['urls'] = {'homeassistant': {'toggle_on': '', 'toggle_off': ''}}
+    config['port'] = None
+    config['metrics_port'] = None
+    config['profiles'] = {}
+    groups = max(1, count // GROUP_SIZE)
+    volume_profiles = {}
+    for index in range(count):
+        watched = application((index + 1) % count)
+        if index % 10 == 1:
+            watched = f"exact:{watched}"
+        elif index % 10 == 2:
+            watched = f"glob:{watched[:-1]}?"
+        elif index % 10 == 3:
+            watched = f"re:^{watched}$"
+        volume_profiles[application(index)] = {
+            'standard': {'headset': 1, 'speaker': 1},
+            f"group{index % groups}": {'headset': .3, 'speaker': .2},
+            watched: {'headset': .5, 'speaker': .4},
+            'hear_through': {'headset': .6, 'speaker': .6},
+        }
+    os.makedirs(os.path.join(directory, 'config'))
+    os.makedirs(os.path.join(directory, 'profiles'))
+    with open(os.path.join(directory, 'config', 'config.yaml'), 'w', encoding='utf-8') as file:
+        yaml.dump(config, file)
+    with open(os.path.join(directory, 'profiles', 'profiles.yaml'), 'w', encoding='utf-8') as file:
+        yaml.dump(volume_profiles, file)
+    with open(os.path.join(directory, 'profiles', 'profiles_microphone.yaml'), 'w', encoding='utf-8') as file:
+        yaml.dump({member(index): 50000 for index in range(0, count, GROUP_SIZE)}, file)
+    for group in range(groups):
+        with open(os.path.join(directory, 'profiles', f'profiles_group{group}.yaml'), 'w', encoding='utf-8') as file:
+            yaml.dump({member(index): 1 for index in range(group * GROUP_SIZE, (group + 1) * GROUP_SIZE)}, file)
+    return os.path.join(directory, 'config', 'config.yaml'), os.path.join(directory, 'profiles')
+
+
+def sessions(count, offset=0):
+    """
+    :param count: number of sessions
+    :param offset: first sink-input index
+    :return: list of AudioSessions, a third controlled applications, a third group members, a third not in the profiles
+    """
+    audio_sessions = []
+    for index in range(offset, offset + count):
+        if index % 3 == 0:
+            name = application(index // 3)
+        elif index % 3 == 1:
+            name = member(index // 3)
+        else:
+            name = f"other{index:05d}"
+        audio_sessions.append(AudioSession(name=name, process=name, process_id=str(index), state=index % 2 == 0,
+                                           current_volume=1))
+    return audio_sessions
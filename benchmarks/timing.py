@@ -0,0 +1,32 @@
+"""
+    Timing helpers shared by the benchmarks
+"""
+import time
+
+
+def repeats(count, budget=2000):
+    """
+    :param count: number of sessions or rules a case runs on
+    :param budget: roughly the number of items to process per case
+    :return: number of repetitions, more for small inputs where a single run is too short to time reliably
+    """
+    return max(5, budget // count)
+
+
+def best_time(function, repeat, setup=None):
+    """
+    :param function: callable to time, gets the result of setup if given
+    :param repeat: number of runs
+    :param setup: callable run untimed before every run
+    :return: best time of one run in seconds
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        if setup is not None:
+            function(argument)
+        else:
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best
@@ -1,35 +1,39 @@
 """
     Sets volume of programs according to the settings
 """
+import time
+STARTED = time.perf_counter()
+import math
 import os
+import signal
 import sys
-import time
-import yaml
 import platform
-from threading import Thread
-from PyQt5.QtGui import *
-from PyQt5.QtWidgets import QApplication, QAction, QMenu, QSystemTrayIcon
-from PyQt5.QtCore import QFile, QTextStream
+from threading import Event, Lock, Thread
 import subprocess
 import logging
 from logging.handlers import RotatingFileHandler
-from waitress import serve
-import requests
-if platform.system() == "Windows":
-    import win32api
-    import win32gui
-    from comtypes import CLSCTX_ALL
-    from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume, ISimpleAudioVolume
-    import sounddevice
-    from ctypes import cast, POINTER    
-    from webhooks import app as webhook_app
-elif platform.system() == "Linux":
-    import re
-    from modules.audiosessions.audiosession import AudioSession
+from modules.profiles.profilecompiler import ProfileCompiler, ProfileWatcher
+from modules.audiosessions.sessionmatcher import SessionMatcher
+from modules.audiosessions.sessionmatcher import get_session_name
+from modules.audiosessions.sessiontable import SessionTable
+from modules.fader.fader import Fader
+from modules.volumecache.volumecache import VolumeCache, WriteCoalescer
+from modules.backends.audiobackend import create_backend
+from modules.devicewatcher.devicewatcher import DeviceWatcher
+from modules.httpsender.httpsender import HttpSender
+from modules.metrics import metrics
+from modules.controlserver.controlserver import ControlServer, NotReadyError
+from modules.rules.ruleengine import RuleEngine
+from modules.trace.trace import TraceRecorder
+from modules.journal import journal
+from modules.checkpoint.checkpoint import Checkpointer, load_checkpoint
+# PyQt5 (tray icon) and requests (webhooks) are imported where they are used, yaml is needed right away by the profile compiler
+IMPORTED = time.perf_counter()
 
 log = logging.getLogger("audiomanager")
 log.setLevel(logging.INFO)  
 
+os.makedirs('./logs', exist_ok=True)
 file_handler = RotatingFileHandler("./logs/audiomanager.log", mode="w", maxBytes= 2*1024*1024, backupCount=3)
 file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
 log.addHandler(file_handler)
@@ -38,44 +42,119 @@ console_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(level
 log.addHandler(console_handler)
 CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 os.makedirs('./config', exist_ok=True)
-os.makedirs('./logs', exist_ok=True)
 os.makedirs('./profiles', exist_ok=True)
 
 class AudioManager:
-    def __init__(self):
+    def __init__(self, backend=None, tray=True, config_path='./config/config.yaml', profiles_path='./profiles',
+                 trace_path=None, host=None, profile_watcher=None, control_server=None,
+                 journal_path='./logs/journal.bin', checkpoint_path='./logs/checkpoint.json'):
+        """
+        :param backend: AudioBackend to use, defaults to the backend of the current platform
+        :param tray: show the tray icon, blocks until the tray is closed
+        :param config_path: path of config.yaml
+        :param profiles_path: directory of the profile files
+        :param trace_path: file to record the inputs and decisions of the control loop to, None to not record
+        :param host: entry of the hosts list in config.yaml (name, server, and speakername and urls overriding
+                     config.yaml for the device detection), None for the sound server of this machine
+        :param profile_watcher: started ProfileWatcher shared with other hosts, None to start one
+        :param control_server: ControlServer shared with other hosts, None to start one with the metrics server
+        :param journal_path: file of the journal of the decisions, None to not keep one
+        :param checkpoint_path: file to checkpoint the volumes and transitions to, None to not checkpoint
+        """
+        # seconds from the start of the process to each startup milestone
+        self.startup = {}
+        self.first_evaluation = Event()
+        self.__mark_startup('imports', IMPORTED)
         # set hear through to off for consistent base settings
-        self.config_path = './config/config.yaml'
+        self.config_path = config_path
         self.log_path = './logs'
-        self.profiles_path = './profiles'
+        self.profiles_path = profiles_path
         self.config = {}
+        self.profile_table = None
+        self.rule_engine = None
         self.hear_through_enabled = False
+        self.toggle_lock = Lock()
+        self.host = host['name'] if host is not None else None
+        # settings of the host replacing the ones of config.yaml for the device watcher, the speakername and webhook urls
+        self.host_settings = {key: value for key, value in (host or {}).items() if key not in ('name', 'server')}
+        # a profile watcher of this instance is stopped with it, a shared one by its owner
+        self.__own_profile_watcher = profile_watcher is None
+        if profile_watcher is None:
+            profile_watcher = ProfileWatcher(ProfileCompiler(self.config_path, self.profiles_path))
+            profile_watcher.start()
+        self.profile_watcher = profile_watcher
         self.__load_config()
+        self.__mark_startup('config')
         self.platform = platform.system()
-        if platform == 'Windows':
-            subprocess.call(f'SoundVolumeView.exe /SetListenToThisDevice "{self.config["microphone_name"]}" 0', shell=True)
-        elif platform == 'Linux':
-            pass
-        self.volume_threads = {}
+        self.backend = backend if backend is not None else create_backend(host['server'] if host is not None else None)
+        self.backend.start(self.profile_table)
+        self.__mark_startup('backend')
+        # every published config or profile change wakes the control loop
+        self.profile_watcher.subscribe(self.backend.wake)
+        self.http_sender = HttpSender()
+        # a device switch is evaluated right away instead of at the next timeout of the control loop
+        self.device_watcher = DeviceWatcher(self.backend, lambda: {**self.config, **self.host_settings},
+                                            self.http_sender, on_change=lambda device: self.backend.wake())
+        self.device_watcher.start()
+        self.journal = None
+        # journal_size: null disables the journal
+        if journal_path is not None and self.config.get('journal_size'):
+            try:
+                self.journal = journal.Journal(journal_path, int(self.config['journal_size'] * 1024 * 1024))
+            except (OSError, ValueError) as err:
+                log.info(f"Failed to open the journal {journal_path}: {err}")
+        # targets of the last evaluation
+        self.targets = {}
+        self.trace_recorder = None
+        if trace_path is not None:
+            self.trace_recorder = TraceRecorder(trace_path, self.backend, self.profile_watcher.compiler)
+        self.volume_cache = VolumeCache()
+        self.write_coalescer = WriteCoalescer(self.volume_cache, self.backend.set_app_volumes, self.backend.get_session_key)
+        self.fader = Fader(self.write_coalescer.write, on_start=self.backend.initialize_thread,
+                           manual=self.backend.virtual_time)
+        if self.backend.virtual_time:
+            # transitions take virtual time like the rest of a simulation
+            self.backend.on_advance = self.fader.advance
+        self.fader.start()
+        self.session_table = SessionTable(self.backend.get_session_key)
+        self.session_index = None
         self.keep_alive = True
         log.info("Initalized")
         self.__get_audio_sessions()
+        self.__mark_startup('first_enumeration')
+        self.checkpointer = None
+        if checkpoint_path is not None and (self.config.get('checkpoint') or {}).get('enabled'):
+            # before the first evaluation, so it finds the transitions of the previous run running
+            self.__resume(checkpoint_path)
+            self.checkpointer = Checkpointer(checkpoint_path, self.__checkpoint_state,
+                                             self.config['checkpoint'].get('interval', 1))
+            self.checkpointer.start()
+            self.__mark_startup('checkpoint')
+        self.metrics_server = None
+        self.control_server = control_server
+        if control_server is None:
+            # metrics_port: null disables the endpoint
+            self.metrics_server = metrics.MetricsServer(metrics.registry, port=self.config.get('metrics_port'))
+            if self.metrics_server.port is not None:
+                self.metrics_server.start()
+            self.control_server = ControlServer(self.toggle, {'playpause': self.backend.play_pause,
+                                                              'togglemute': self.backend.toggle_mute},
+                                                port=self.config['port'])
+            # port: null disables the API
+            if self.config['port'] is not None:
+                self.control_server.start()
         Thread(target=self.__auto_volume, daemon=False).start()
-        Thread(target=self.webhooker, daemon=True).start()
-        self.tray_menu()
-
-    def webhooker(self):
-        # subprocess.call("waitress-serve --listen *:5000 wsgi:app")
-        if self.platform == 'Windows':
-            serve(webhook_app, listen=f"*:{self.config['port']}")
+        if tray:
+            self.tray_menu()
 
     def __toggle_hear_through(self):
         try:
             if not self.hear_through_enabled: # and self.__get_current_audio_device() == 'headset':
                 log.info(f"Set hear through: on")
-                subprocess.call(f'SoundVolumeView.exe /SetListenToThisDevice "TonorMikrofon" 1', shell=True)
+                self.backend.set_hear_through("TonorMikrofon", True)
             else:
                 log.info(f"Set hear through: off")
-                subprocess.call(f'SoundVolumeView.exe /SetListenToThisDevice "TonorMikrofon" 0', shell=True)
+                self.backend.set_hear_through("TonorMikrofon", False)
         except:
             log.info("Could not toggle hear through, wrong ground state.")
         else:
@@ -86,13 +165,27 @@ class AudioManager:
         manages the combination of volume profiles and sets the volume
         :return:
         """
-        if self.platform == 'Windows':
-            import pythoncom
-            pythoncom.CoInitialize()
+        self.backend.initialize_thread()
 
+        sessions_changed = True
+        hear_through_enabled = self.hear_through_enabled
+        current_audio_device = None
+        previous_audio_device = None
         while self.keep_alive:
-            self.__load_config()
+            tick_started = time.perf_counter()
+            with metrics.phase_latency.time('load_config'):
+                config_changed = self.__load_config() or hear_through_enabled != self.hear_through_enabled
+            hear_through_enabled = self.hear_through_enabled
             self.__get_audio_sessions()
+            device_changed = current_audio_device != self.__get_current_audio_device()
+            if not (sessions_changed or config_changed or device_changed):
+                # nothing the rules depend on changed since the last evaluation
+                metrics.ticks.inc('skipped')
+                metrics.phase_latency.observe(time.perf_counter() - tick_started, 'tick')
+                sessions_changed = self.__wait_for_sessions()
+                continue
+            metrics.ticks.inc('evaluated')
+            evaluation_started = time.perf_counter()
             # self.__set_capture_card_volume()
             current_audio_device = self.__get_current_audio_device()
 
@@ -113,332 +206,375 @@ class AudioManager:
             else:
                 microphone_offset = 0
 
-            if mic_gain is not None:
-                self.__set_microphone_gain(mic_gain-microphone_offset)
+            microphone_gain = mic_gain - microphone_offset if mic_gain is not None else None
+            if microphone_gain is not None:
+                self.__set_microphone_gain(microphone_gain)
             self.__set_capture_card_volume()
-            for application_to_set in self.volume_profiles:
-                # skip if application is not running
-                target_session = self.__match_processes(application_to_set)
+            if self.config['check_watched_application_state']:
+                self.backend.watch_activity(self.rule_engine.watched_sessions(self.session_index))
+            else:
+                self.backend.watch_activity([])
+            # only the targets whose watched applications, groups or device changed are recomputed
+            targets = self.rule_engine.update(self.session_index, self.backend.get_session_key,
+                                              self.backend.is_session_active, current_audio_device,
+                                              self.hear_through_enabled)
+            if self.journal is not None:
+                self.__journal_evaluation(current_audio_device != previous_audio_device, targets)
+            previous_audio_device = current_audio_device
+            for application_to_set, (target_session, target_volume) in targets.items():
+                self.__set_app_volume(application_to_set, target_session, target_volume)
+
+            self.targets = dict(self.rule_engine.targets)
+            self.__publish_state(current_audio_device, self.targets)
+            if self.trace_recorder is not None:
+                self.trace_recorder.record_decisions(self.rule_engine.targets, microphone_gain)
+            tick_finished = time.perf_counter()
+            metrics.phase_latency.observe(tick_finished - evaluation_started, 'evaluate')
+            metrics.phase_latency.observe(tick_finished - tick_started, 'tick')
+            if not self.first_evaluation.is_set():
+                self.__mark_startup('first_evaluation', tick_finished)
+                log.info(f"Startup: {self.startup_report()}")
+                self.first_evaluation.set()
+            sessions_changed = self.__wait_for_sessions()
+
+    def __journal_evaluation(self, device_changed, targets):
+        """
+        writes the changes of the device, the activity of the watched applications and the targets to the journal
+        :param device_changed: True if the output device changed since the last evaluation
+        :param targets: dict of controlled application -> (session, target volume) of the recomputed targets
+        :return:
+        """
+        if device_changed:
+            self.journal.write(journal.DEVICE, self.rule_engine.device, cause=self.device_watcher.output or '')
+        for pattern in self.rule_engine.changed_statuses:
+            status = self.rule_engine.statuses.get(pattern)
+            if status is None:
+                self.journal.write(journal.ACTIVITY, pattern)
+            else:
+                self.journal.write(journal.ACTIVITY, pattern, status[0], active=status[1])
+        for application, (session, target_volume) in targets.items():
+            previous = self.targets.get(application, math.nan)
+            if previous != target_volume:
+                self.journal.write(journal.TARGET, application, self.backend.get_session_key(session), target_volume,
+                                   previous, self.rule_engine.causes[application])
+
+    def __resume(self, path):
+        """
+        takes over the commanded and original volumes and the running transitions of the previous run
+        for the sessions which still exist under the same name
+        :param path: checkpoint file
+        :return:
+        """
+        state = load_checkpoint(path)
+        if state is None:
+            return
+        records = self.session_table.records
 
-                if not target_session:
-                    continue
-                # log.debug(f"Target session found: {target_session}")
-                # base volume to set to if no app is found, will be set to the lowest matched value
-                target_volume = self.volume_profiles[application_to_set]["standard"][current_audio_device]
-                profile_applications = self.volume_profiles[application_to_set]
-                for application_to_watch in profile_applications:
-                    # skip if application is not running
-                    session = self.__match_processes(application_to_watch)
-                    log.debug(f'Matching result {session} - {application_to_watch}, {application_to_set}')
-                    # check if hear through is activated
-                    if application_to_watch == "hear_through" and self.hear_through_enabled:
-                        pass
-                    elif not session and not self.config['reset_volume_sessions']:
-                        continue
-                    elif self.config['reset_volume_sessions']:
-                        target_volume = 1
-                        break
-                    elif not self.is_profile_active(application_to_watch):
-                        continue
-                    elif self.platform == "Windows":
-                        if (not session.State or session.SimpleAudioVolume.GetMute()) and self.config['check_watched_application_state']:
-                            # if session is not playing audio or muted
-                            log.debug('Skpping because sessions is muted')
-                            continue
-                    elif self.platform == "Linux":
-                        if not session.State and self.config['check_watched_application_state']:
-                            # if session is not playing audio or muted
-                            log.debug('Skpping because sessions is muted')
-                            continue
-
-                    # get the lowest volume for application
-                    if profile_applications[application_to_watch][current_audio_device] < target_volume or \
-                            profile_applications["standard"][current_audio_device] == target_volume == 0:
-                        target_volume = profile_applications[application_to_watch][current_audio_device]
-                    else:
-                        log.debug(f"Skipping {application_to_set}, {application_to_watch}")
-
-                # queue thread for setting volume
-                application_thread = Thread(target=self.__set_app_volume,
-                                            args=(target_session, target_volume, session),
-                                            daemon=True)
-                self.__queue__set_app_volume(application_thread, application_to_set)
-
-            time.sleep(1)
-
-    def is_profile_active(self, application_profile):
-        for key in self.profile_applications.keys():
-            # if application profile (e.g. 'communication' for 'discord', 'atmgr', etc) is not active:
-            # check if application is in said profile
-            if application_profile in self.profile_applications[key] and not self.config['profiles'][key]:
-                return False
+        def live_record(key, name):
+            record = records.get(key)
+            return record if record is not None and record.name == name else None
 
-        return True
+        try:
+            commanded = {}
+            originals = {}
+            for key, name, commanded_volume, original_volume in state['sessions']:
+                if live_record(key, name) is None:
+                    continue
+                if commanded_volume is not None:
+                    commanded[key] = commanded_volume
+                if original_volume is not None:
+                    originals[key] = original_volume
+            self.volume_cache.restore(commanded, originals)
+            resumed = 0
+            for application, key, name, target_volume, step in state['ramps']:
+                record = live_record(key, name)
+                if record is None:
+                    continue
+                current_volume = self.backend.get_app_volume(record.session)
+                if current_volume is None:
+                    continue
+                # the transition went on after the last checkpoint, the commanded volume is only kept if it is current
+                current_volume = self.volume_cache.observe(key, current_volume)
+                resumed += self.fader.resume(application, record.session, current_volume, target_volume, step)
+        except (KeyError, TypeError, ValueError) as err:
+            log.info(f"Ignoring the checkpoint {path}: {err}")
+            return
+        log.info(f"Resumed {len(commanded)} volumes and {resumed} transitions from {path}")
 
-    def __get_audio_sessions(self):
+    def __checkpoint_state(self):
+        """
+        :return: the commanded and original volumes and the running transitions, with the names of their
+                 sessions to recognize them after a restart
         """
-        sets self.audio_sessions to a list of lists with (process_name, process_id) as elements
+        commanded, originals = self.volume_cache.snapshot()
+        records = self.session_table.records
+        sessions = []
+        for key in {**commanded, **originals}:
+            record = records.get(key)
+            if record is not None:
+                sessions.append([key, record.name, commanded.get(key), originals.get(key)])
+        ramps = [[application, self.backend.get_session_key(session), get_session_name(session), target_volume, step]
+                 for application, (session, current_volume, target_volume, step) in self.fader.snapshot().items()]
+        return {'sessions': sessions, 'ramps': ramps}
+
+    def __restore_original_volumes(self):
+        """
+        sets the sessions back to their volumes before the first transition in one batch, sessions whose
+        volume was changed by something else since are left as they are
         :return:
         """
-        def get_application_parameter(application, parameter):
-            try:
-                substring = application.split(parameter)[1].split('\n')[0]
-            except IndexError:
-                log.debug('Failed to grab "{parameter}" from application')
-                return None
-            value = substring.strip('=: "')
-            log.debug(f'"{parameter}": "{value}"')
-            return value
-
-        if self.platform == 'Windows':
-            self.audio_sessions = AudioUtilities.GetAllSessions()
-            if self.config['list_active_audio_sessions']:
-                log.info("Active Audio Sessions")
-                for session in self.audio_sessions:
-                    try:
-                        log.info(session.Process.name())
-                    except AttributeError:
-                        pass
-        elif self.platform == "Linux":
-            result = subprocess.run(['pactl', 'list', 'sink-inputs'], stdout=subprocess.PIPE)
-            output = result.stdout.decode('utf-8')
-            applications = [application for application in output.split("Sink Input ") if application != ""]
-            self.audio_sessions = []
-            for application in applications:
-                name = get_application_parameter(application, 'node.name')
-                process = get_application_parameter(application, 'application.process.binary')
-                process_id = application.split("\n")[0].strip("# ")
-                state= True if get_application_parameter(application, 'Mute') == "no" else False
-                current_volume = int(re.search(r'(\d+)%', application.split('Volume')[1].split('\n')[0]).group(1))/100
-                self.audio_sessions.append(AudioSession(name=name, process=process, process_id=process_id, state=state, current_volume=current_volume))
-
-    def __get_current_audio_device(self):
+        commanded, originals = self.volume_cache.snapshot()
+        records = self.session_table.records
+        batch = [(records[key].session, original) for key, original in originals.items()
+                 if key in records and key in commanded]
+        if batch:
+            self.backend.initialize_thread()
+            self.write_coalescer.write(batch)
+        log.info(f"Restored the volumes of {len(batch)} sessions")
+
+    def __mark_startup(self, milestone, timestamp=None):
+        seconds = (time.perf_counter() if timestamp is None else timestamp) - STARTED
+        self.startup[milestone] = seconds
+        metrics.startup.set(seconds, milestone)
+
+    def startup_report(self):
+        """
+        :return: milliseconds from the start of the process to each startup milestone reached so far
         """
+        return ', '.join(f"{milestone} {seconds*1000:.0f} ms" for milestone, seconds in self.startup.items())
 
+    def __publish_state(self, audio_device, targets):
+        """
+        hands the state of the last evaluation to the control server
+        :param audio_device: 'headset' or 'speaker'
+        :param targets: dict of controlled application -> resolved target volume
         :return:
         """
-        if self.platform == "Windows":
-            sounddevice._terminate()
-            sounddevice._initialize()
-            
-            if self.config['speakername'] in str(sounddevice.query_devices(sounddevice.default.device[1])):
-                try:
-                    requests.post(self.config['urls']['homeassistant']['toggle_off'])
-                except:
-                    return 'headset'
-                else:
-                    return 'speaker'
-            else:
-                try:
-                    requests.post(self.config['urls']['homeassistant']['toggle_on'])
-                except:
-                    return 'headset'
-                else:
-                    return 'headset'
-        elif self.platform == "Linux":
-            return "speaker"
+        self.control_server.publish({
+            'active': self.config['active'],
+            'audio_device': audio_device,
+            'hear_through': self.hear_through_enabled,
+            'toggles': {
+                'capture_card': self.config['capture_card']['state'],
+                'check_watched_application_state': self.config['check_watched_application_state'],
+                'reset_volume_sessions': self.config['reset_volume_sessions'],
+            },
+            'profiles': dict(self.config['profiles']),
+            'version': self.profile_table.version,
+            'sessions': [{'name': record.name,
+                          'id': str(self.backend.get_session_key(record.session)),
+                          'active': self.backend.is_session_active(record.session)}
+                         for record in self.session_table.records.values()],
+            'targets': targets,
+        }, host=self.host)
+
+    def __wait_for_sessions(self):
+        """
+        waits until the audio sessions changed or the config has to be checked again
+        :return: True if the audio sessions changed
+        """
+        return self.backend.wait_for_sessions(timeout=1)
 
-    def __load_config(self):
+    def __get_audio_sessions(self):
         """
+        updates self.session_table with the current sessions and the index of them by the profile entries
+        in self.session_index, only the sessions which changed are matched again
         :return:
         """
-        while True:
-            try:
-                with open(self.config_path, "r", encoding="utf-8") as cf:
-                    self.config = yaml.load(cf, yaml.Loader)
-                
-                with open(os.path.join(self.profiles_path, "profiles.yaml"), "r", encoding="utf-8") as pf:
-                    self.volume_profiles = yaml.load(pf, yaml.Loader)
-
-                self.profile_applications = {}
-                for file in [os.path.join(self.profiles_path, file) 
-                             for file in os.listdir(self.profiles_path) 
-                             if file.startswith('profiles_') and not "microphone" in file]:
-                    matched_profiles = []
-                    with open(file, "r", encoding="utf-8") as gpf:
-                        profiles = yaml.load(gpf, yaml.Loader)
-
-                    profile_id = os.path.basename(file).replace("profiles_", '').replace(".yaml",'')
-                    if profile_id not in self.config['profiles']:
-                        self.config['profiles'][profile_id] = True
-
-                    self.profile_applications[profile_id] = profiles.keys()
-                    for profile in profiles:
-                        # add profiles for each subprofile
-                        if profile_id in self.volume_profiles:
-                            self.volume_profiles[profile] = self.volume_profiles[profile_id].copy()
-                            self.volume_profiles[profile]["standard"] = {"headset": profiles[profile],
-                                                                         "speaker": profiles[profile]}
-                        # add suprofiles for each profile if the profile id is present in a volume setting
-                        # iterate through profiles which are used
-                        for volpro in self.volume_profiles.items():
-                            if profile_id in volpro[1].keys():
-                                setting = volpro[1][profile_id]
-
-                                self.volume_profiles[volpro[0]][profile] = setting
-                                matched_profiles.append([volpro[0], profile_id])
-
-                    # print(self.volume_profiles)
-                    if profile_id in self.volume_profiles:
-                        self.volume_profiles.pop(profile_id)
-                    for mp in matched_profiles:
-                        try:
-                            del(self.volume_profiles[mp[0]][mp[1]])
-                        except KeyError:
-                            pass
-                # print(self.volume_profiles)
-
-                log.debug(f'Profiles: {self.volume_profiles}')
-                with open(os.path.join(self.profiles_path, "profiles_microphone.yaml"), "r", encoding="utf-8") as pf:
-                    self.mic_profiles = yaml.load(pf, yaml.Loader)
-                if 'microphone' not in self.config['profiles']:
-                    self.config['profiles']['microphone'] = True
-
-                self.dev_log = self.config['dev_log']
-
-            except AttributeError as err:
-                log.info("Failed to load config.yaml.", err)
-                time.sleep(5)
+        with metrics.phase_latency.time('get_audio_sessions'):
+            delta = self.session_table.update(self.backend.get_audio_sessions())
+        metrics.sessions.set(len(self.session_table), self.host or 'local')
+        if self.config['list_active_audio_sessions']:
+            log.info("Active Audio Sessions")
+            for record in self.session_table.records.values():
+                log.info(record.name)
+        if self.trace_recorder is not None:
+            self.trace_recorder.record_inputs(self.profile_table, self.session_table, self.device_watcher.output,
+                                              self.hear_through_enabled)
+        if self.journal is not None:
+            for record in delta.added:
+                self.journal.write(journal.ADDED, record.name or '', record.key, active=bool(record.state))
+            for record in delta.removed:
+                self.journal.write(journal.REMOVED, record.name or '', record.key)
+        if delta.removed:
+            removed = [self.backend.get_session_key(record.session) for record in delta.removed]
+            self.volume_cache.forget_sessions(removed)
+            # their volume can't be set anymore
+            self.fader.cancel_sessions(removed, self.backend.get_session_key)
+        with metrics.phase_latency.time('match'):
+            if self.session_index is None or self.session_index.matcher is not self.session_matcher:
+                self.session_index = self.session_matcher.index(self.session_table.records.values())
             else:
-                break
-            self.__save_config()
+                self.session_index.update(delta)
 
-    def __match_processes(self, process: str):
+    def __get_current_audio_device(self):
         """
+        :return: 'headset' or 'speaker', as last detected by the device watcher
+        """
+        return self.device_watcher.device
 
-        :return:
+    def __load_config(self):
         """
-        named_sessions = []
-        
-        for session in self.audio_sessions:
-            try:
-                try:
-                    session_name = session.Process.name()
-                except:
-                    session_name = session.DisplayName
-                named_sessions.append([session, session_name])
-            except AttributeError as e:
-                log.debug(f"AttributeError while adding session for matching")
-                log.debug(e)
-        log.debug([e[1] for e in named_sessions])
-        matched_sessions = [session[0] for session in named_sessions if
-                            process.lower() in session[1].lower()]
-        if len(matched_sessions) > 1:
-            for session in matched_sessions:
-                if session.State == 1:
-                    # if multiple sessions, return the active session or the last session
-                    return session
-            else:
-                return session
-        elif len(matched_sessions) == 0:
+        takes over the latest profile table compiled by the profile watcher
+        :return: True if the config or profiles differ from the previously loaded ones
+        """
+        table = self.profile_watcher.table
+        if table is self.profile_table:
             return False
-        else:
-            # if only one session, return that session
-            return matched_sessions[0]
+        self.profile_table = table
+        self.config = table.config
+        self.volume_profiles = table.volume_profiles
+        self.profile_applications = table.profile_applications
+        self.mic_profiles = table.mic_profiles
+        self.dev_log = table.dev_log
+        patterns = set(self.mic_profiles)
+        for application, profile_applications in self.volume_profiles.items():
+            patterns.add(application)
+            patterns.update(profile_applications)
+        self.session_matcher = SessionMatcher(patterns)
+        if self.rule_engine is None or not self.rule_engine.adopt(table):
+            self.rule_engine = RuleEngine(table)
+        return True
+
+    def __match_processes(self, process: str):
+        """
+        looks up the session matching the profile entry in the index of the current sessions
+        :return: the matching session or False
+        """
+        return self.session_index.get(process)
 
     def __open_settings(self, file: str):
         log.info(f"Opening {file}")
         subprocess.call(f"notepad.exe {os.path.join(self.profiles_path, file)}", shell=True)
 
-    def __save_config(self):
-        with open(self.config_path, "w", encoding="utf-8") as cf:
-            yaml.dump(self.config, cf)
-
-    def __queue__set_app_volume(self, thread_element, thread_name):
+    def stop(self):
         """
-
-        :param thread_element:
-        :param thread_name:
+        stops the control loop and releases the audio backend
         :return:
         """
-        for running_thread in self.volume_threads.copy():
-            if not self.volume_threads[running_thread].is_alive():
-                self.volume_threads[running_thread].join()
-                self.volume_threads.pop(running_thread)
-
-        if thread_name in self.volume_threads:
-            return
-        else:
-            self.volume_threads[thread_name] = thread_element
-            self.volume_threads[thread_name].start()
+        self.keep_alive = False
+        self.fader.stop()
+        if self.checkpointer is not None:
+            self.checkpointer.stop()
+            self.__finish_checkpoint()
+        self.device_watcher.stop()
+        self.http_sender.close()
+        if self.metrics_server is not None:
+            # the servers were started by this instance, not shared with other hosts
+            self.metrics_server.stop()
+            self.control_server.stop()
+        self.backend.stop()
+        if self.trace_recorder is not None:
+            self.trace_recorder.close()
+        if self.journal is not None:
+            self.journal.close()
+        if self.__own_profile_watcher:
+            self.profile_watcher.stop()
+
+    def __finish_checkpoint(self):
+        """
+        restores the original volumes and removes the checkpoint, or with restore_on_exit off, checkpoints
+        the final state for the next start
+        :return:
+        """
+        try:
+            if self.config['checkpoint'].get('restore_on_exit', True):
+                self.__restore_original_volumes()
+                self.checkpointer.remove()
+            else:
+                self.checkpointer.save()
+        except Exception as err:
+            log.info(f"Failed to finish the checkpoint: {err}")
 
     def __quit(self):
-        self.keep_alive = False
+        self.stop()
         self.app.quit()
         exit()
 
-    def __set_app_volume(self, audio_session, target_volume, watched_session = None):
+    def __set_app_volume(self, application, audio_session, target_volume):
         """
-
+        hands the transition to the target volume over to the fader
+        :param application: name of the controlled application, running transitions of it are retargeted
         :param audio_session:
         :param target_volume:
-        :param watched_session:
         :return:
         """
-        if self.platform == "Windows":
-            try:
-                current_volume = round(audio_session.SimpleAudioVolume.GetMasterVolume(), 3)
-            except:
-                return
-        elif self.platform == "Linux":
-            current_volume = audio_session.current_volume
-        
-        log.debug(f'{audio_session.name}, {target_volume}')
-
-        if current_volume == target_volume or not self.config['active']:
+        current_volume = self.backend.get_app_volume(audio_session)
+        if current_volume is None:
             return
-        volume_steps = (target_volume - current_volume)/self.config['transition_length']
-        if volume_steps < 0:
-            volume_steps *= (self.config['transition_length']/2)
+        # the commanded volume is exact, the reported one may be rounded
+        current_volume = self.volume_cache.observe(self.backend.get_session_key(audio_session), current_volume)
 
-        try:
-            session_name = audio_session.Process.name()
-        except:
-            session_name = audio_session.DisplayName
-        log.info(f"Setting volume for {session_name} to {target_volume*100}%.")
-
-        while (current_volume + volume_steps < target_volume and current_volume < target_volume) or \
-                (current_volume + volume_steps > target_volume and current_volume > target_volume):
-            if self.platform == "Windows":
-                audio_session.SimpleAudioVolume.SetMasterVolume(current_volume + volume_steps, None)
-            elif self.platform == "Linux":
-                subprocess.run(['pactl', 'set-sink-input-volume', audio_session.Process.id, f'{(current_volume + volume_steps)*100}%'])
-            current_volume += volume_steps
-            time.sleep(.05)
-        if self.platform == "Windows":
-            audio_session.SimpleAudioVolume.SetMasterVolume(target_volume, None)
-        elif self.platform == "Linux":
-            subprocess.run(['pactl', 'set-sink-input-volume', audio_session.Process.id, f'{(target_volume)*100}%'])
+        session_name = get_session_name(audio_session)
+        log.debug('%s, %s', session_name, target_volume)
+
+        if not self.config['active']:
+            return
+        if self.fader.fade(application, audio_session, current_volume, target_volume, self.config['transition_length']):
+            self.volume_cache.remember_original(self.backend.get_session_key(audio_session), current_volume)
+            if self.journal is not None:
+                self.journal.write(journal.FADE, application, self.backend.get_session_key(audio_session),
+                                   target_volume, current_volume)
+            log.info(f"Setting volume for {session_name} to {target_volume*100}%.")
 
     def __set_capture_card_volume(self):
-        if self.platform == "Windows":
-            self.__get_audio_sessions()
-            process = self.__match_processes(process="svchost.exe")
-            volume = self.config['capture_card']['mode_on'] if self.config['capture_card']['state'] else self.config['capture_card']['mode_off']
-            self.__set_app_volume(process, int(volume))
-        elif self.platform == "Linux":
-            pass
+        if self.backend.capture_card_process is None:
+            return
+        self.__get_audio_sessions()
+        process = self.__match_processes(process=self.backend.capture_card_process)
+        volume = self.config['capture_card']['mode_on'] if self.config['capture_card']['state'] else self.config['capture_card']['mode_off']
+        self.__set_app_volume(self.backend.capture_card_process, process, int(volume))
 
     def __set_microphone_gain(self, gain):
-        if self.platform == "Windows":
-            if self.dev_log: log.info(f"Setting mic gain to {gain}")
-            # os.system(f"nircmdc.exe loop 1 250 setsysvolume {gain} default_record")
-            try:
-                subprocess.call(f"nircmdc.exe loop 1 250 setsysvolume {gain} default_record", shell=True)
-            except PermissionError:
-                log.info("Error: Microphone access denied")
+        if not self.volume_cache.device_changed('microphone', gain):
+            return
+        if self.dev_log: log.info(f"Setting mic gain to {gain}")
+        self.backend.set_microphone_gain(gain)
+
+    def toggle(self, para: str):
+        """
+        toggles a setting, a profile or hear through and wakes the control loop to apply it right away
+        :param para: name of the setting
+        :return: the new value
+        """
+        with self.toggle_lock:
+            if para == 'hear_through':
+                self.__toggle_hear_through()
+                value = self.hear_through_enabled
+            elif para in self.config['profiles'] or \
+                    para in ('active', 'capture_card', 'check_watched_application_state', 'reset_volume_sessions'):
+                value = self.__toggle_settings(para)
+            else:
+                raise KeyError(para)
+        if self.journal is not None:
+            self.journal.write(journal.TOGGLE, para, active=bool(value))
+        self.backend.wake()
+        return value
 
     def __toggle_settings(self, para: str):
-        try:
-            self.config[para] = not self.config[para]
-            log.info(f"Set {para} to: {self.config[para]}")
-        except:
-            self.config['profiles'][para] = not self.config['profiles'][para]
-            log.info(f"Set {para} to: {self.config['profiles'][para]}")
+        """
+        publishes a config with the setting toggled, the control loop is woken by it and config.yaml
+        is written in the background
+        :return: the new value of the setting
+        """
+        def toggle_setting(config):
+            # a copy of the latest config, so toggles in quick succession build on each other
+            if para == 'capture_card':
+                settings, key = config['capture_card'], 'state'
+            elif para in config['profiles']:
+                settings, key = config['profiles'], para
+            else:
+                settings, key = config, para
+            settings[key] = not settings[key]
+            return settings[key]
 
-        self.__save_config()
+        value = self.profile_watcher.update_config(toggle_setting)
+        log.info(f"Set {para} to: {value}")
+        return value
 
     def tray_menu(self):
+        from PyQt5.QtGui import QIcon
+        from PyQt5.QtWidgets import QApplication, QAction, QMenu, QSystemTrayIcon
         log.info("Launching Tray Icon")
         self.app = QApplication([])
         self.icon = QIcon("icons/icon.ico")
@@ -450,18 +586,19 @@ class AudioManager:
         # Tray-Menu
         menu = QMenu()
 
-        menu.addAction('Toggle audiomanager', lambda: self.__toggle_settings('active'))
-        menu.addAction('Toggle hear-through', lambda: self.__toggle_hear_through())
-        menu.addAction('Toggle capture card audio', lambda: self.__toggle_settings('capture_card'))
-        menu.addAction('Toggle application check', lambda: self.__toggle_settings('check_watched_application_state'))
+        menu.addAction('Toggle audiomanager', lambda: self.toggle('active'))
+        menu.addAction('Toggle hear-through', lambda: self.toggle('hear_through'))
+        menu.addAction('Toggle capture card audio', lambda: self.toggle('capture_card'))
+        menu.addAction('Toggle application check', lambda: self.toggle('check_watched_application_state'))
         menu.addSeparator()
-        for file in [file for file in os.listdir(self.profiles_path) if file.startswith('profile') and file.endswith('.yaml')]:
-            audio_option = file.replace('profiles_','').replace('.yaml','') if file != 'profiles.yaml' else 'profiles'
+        # profiles.yaml holds the rules, only the group files can be toggled
+        for file in [file for file in os.listdir(self.profiles_path) if file.startswith('profiles_') and file.endswith('.yaml')]:
+            audio_option = file.replace('profiles_','').replace('.yaml','')
             action = QAction(f'Toggle {audio_option}', menu)
-            action.triggered.connect(lambda checked, arg=audio_option: self.__toggle_settings(arg))
+            action.triggered.connect(lambda checked, arg=audio_option: self.toggle(arg))
             menu.addAction(action)
         menu.addSeparator()
-        menu.addAction('Reset', lambda: self.__toggle_settings('reset_volume_sessions'))
+        menu.addAction('Reset', lambda: self.toggle('reset_volume_sessions'))
         menu.addSeparator()
         for file in [file for file in os.listdir(self.profiles_path) if file.startswith('profile') and file.endswith('.yaml')]:
             audio_option = file.replace('profiles_','').replace('.yaml','') if file != 'profiles.yaml' else 'profiles'
@@ -479,14 +616,244 @@ class AudioManager:
         log.info("Tray started.")
         self.app.exec_()
 
-def main():
-    app = AudioManager()
+class MultiHostManager:
+    def __init__(self, config_path='./config/config.yaml', profiles_path='./profiles', trace_path=None):
+        """
+        runs one control loop per sound server listed under hosts in config.yaml, all with the same profiles,
+        each with its own connection, fader and device, so a slow or unreachable server only delays itself
+        :param config_path: path of config.yaml
+        :param profiles_path: directory of the profile files
+        :param trace_path: prefix of the trace files, one per host, None to not record
+        """
+        self.profile_watcher = ProfileWatcher(ProfileCompiler(config_path, profiles_path))
+        self.profile_watcher.start()
+        config = self.profile_watcher.table.config
+        self.managers = {}
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.control_server = ControlServer(self.toggle, {'playpause': self.__play_pause}, port=config['port'])
+        self.serve_api = config['port'] is not None
+        self.metrics_server = metrics.MetricsServer(metrics.registry, port=config.get('metrics_port'))
+        threads = [Thread(target=self.__start_host, daemon=True,
+                          args=(host, config_path, profiles_path,
+                                f"{trace_path}.{host['name']}" if trace_path is not None else None))
+                   for host in config['hosts']]
+        for thread in threads:
+            thread.start()
+        if self.metrics_server.port is not None:
+            self.metrics_server.start()
+        if self.serve_api:
+            self.control_server.start()
+
+    def __start_host(self, host, config_path, profiles_path, trace_path):
+        """
+        starts managing a host, an unreachable server does not fail this, its connection, session subscription
+        and device detection retry in the background until it can be reached
+        """
+        try:
+            manager = AudioManager(tray=False, config_path=config_path, profiles_path=profiles_path,
+                                   trace_path=trace_path, host=host, profile_watcher=self.profile_watcher,
+                                   control_server=self.control_server,
+                                   journal_path=f"./logs/journal-{host['name']}.bin",
+                                   checkpoint_path=f"./logs/checkpoint-{host['name']}.json")
+        except Exception as err:
+            log.info(f"Failed to start managing {host['name']}: {err}")
+            return
+        with self.__lock:
+            if self.__stopped.is_set():
+                # stopped while the host was started
+                manager.stop()
+                return
+            self.managers[host['name']] = manager
+        self.control_server.actions[f"togglemute/{host['name']}"] = manager.backend.toggle_mute
+        log.info(f"Managing {host['name']} ({host.get('server') or 'local'})")
+
+    def toggle(self, para: str):
+        """
+        toggles a setting or profile for all hosts, hear through is toggled on every host
+        :param para: name of the setting
+        :return: the new value
+        """
+        with self.__lock:
+            managers = list(self.managers.values())
+        if not managers:
+            raise NotReadyError("No host is managed yet")
+        if para == 'hear_through':
+            values = [manager.toggle(para) for manager in managers]
+            return values[0]
+        # the config is shared, publishing it wakes the control loops of all hosts
+        return managers[0].toggle(para)
+
+    def __play_pause(self):
+        # a media key of this machine
+        with self.__lock:
+            managers = list(self.managers.values())
+        if not managers:
+            raise NotReadyError("No host is managed yet")
+        managers[0].backend.play_pause()
+
+    def stop(self):
+        with self.__lock:
+            self.__stopped.set()
+            managers = list(self.managers.values())
+        for manager in managers:
+            manager.stop()
+        self.profile_watcher.stop()
+        self.control_server.stop()
+        self.metrics_server.stop()
+
+def main(trace_path=None):
+    app = AudioManager(trace_path=trace_path)
+
+def headless(trace_path=None):
+    """
+    runs the control loop without the tray icon until SIGINT or SIGTERM, e.g. as a systemd service
+    :return:
+    """
+    stopped = Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    if ProfileCompiler('./config/config.yaml', './profiles').compile().config.get('hosts'):
+        app = MultiHostManager(trace_path=trace_path)
+    else:
+        app = AudioManager(tray=False, trace_path=trace_path)
+    # waiting with a timeout keeps the main thread responsive to signals on Windows
+    while not stopped.wait(1):
+        pass
+    log.info("Stopping")
+    app.stop()
+
+def startup_report(budget):
+    """
+    starts headless, prints the startup milestones and stops again
+    :param budget: milliseconds the first enumeration of the audio sessions may take at most
+    :return: exit code, 1 if the budget was exceeded
+    """
+    import shutil
+    import tempfile
+    import yaml
+    # a running instance keeps its journal, checkpoint, ports and webhooks to itself
+    directory = tempfile.mkdtemp(prefix='audiomanager-startup-')
+    with open('./config/config.yaml', encoding='utf-8') as file:
+        config = yaml.load(file, yaml.SafeLoader)
+    with open(os.path.join(directory, 'config.yaml'), 'w', encoding='utf-8') as file:
+        yaml.dump(offline_config(config), file)
+    app = AudioManager(tray=False, config_path=os.path.join(directory, 'config.yaml'), journal_path=None,
+                       checkpoint_path=None)
+    app.first_evaluation.wait(30)
+    app.stop()
+    shutil.rmtree(directory, ignore_errors=True)
+    print(f"Startup: {app.startup_report()}")
+    first_enumeration = app.startup['first_enumeration'] * 1000
+    print(f"First enumeration after {first_enumeration:.0f} ms, budget {budget:.0f} ms")
+    return 0 if first_enumeration <= budget else 1
+
+def offline_config(config):
+    """
+    :param config: dict of config.yaml
+    :return: a copy without webhooks, control API and metrics endpoint, so a startup report, simulation or
+             replay does not call webhooks or take the ports of a running instance
+    """
+    return {**config, 'urls': {'homeassistant': {'toggle_on': '', 'toggle_off': ''}}, 'port': None,
+            'metrics_port': None}
+
+def simulate(session_count, duration):
+    """
+    runs the control loop headless against synthetic sessions and reports latency and CPU usage
+    :param session_count: number of synthetic sessions
+    :param duration: virtual seconds to simulate
+    :return:
+    """
+    import shutil
+    import tempfile
+    import yaml
+    from modules.backends.simulatedbackend import SimulatedBackend
+    log.setLevel(logging.WARNING)
+    directory = tempfile.mkdtemp(prefix='audiomanager-simulation-')
+    shutil.copytree('./profiles', os.path.join(directory, 'profiles'))
+    with open('./config/config.yaml', encoding='utf-8') as file:
+        config = yaml.load(file, yaml.SafeLoader)
+    with open(os.path.join(directory, 'config.yaml'), 'w', encoding='utf-8') as file:
+        yaml.dump(offline_config(config), file)
+    backend = SimulatedBackend(session_count, duration=duration)
+    app = AudioManager(backend=backend, tray=False, config_path=os.path.join(directory, 'config.yaml'),
+                       profiles_path=os.path.join(directory, 'profiles'), journal_path=None, checkpoint_path=None)
+    backend.finished.wait()
+    # before stopping, which waits for the threads and servers
+    report = backend.report()
+    app.stop()
+    shutil.rmtree(directory, ignore_errors=True)
+    print(report)
+
+def replay(trace_path, output_path):
+    """
+    runs the control loop against a recorded trace at full speed and compares the decisions
+    :param trace_path: trace recorded with --record
+    :param output_path: file to record the replayed inputs and decisions to
+    :return: exit code, 1 if any decision differs from the recorded one
+    """
+    import tempfile
+    import yaml
+    from modules.backends.replaybackend import ReplayBackend
+    from modules.trace.trace import compare
+    log.setLevel(logging.WARNING)
+    backend = ReplayBackend(trace_path)
+    directory = tempfile.mkdtemp(prefix='audiomanager-replay-')
+    os.makedirs(os.path.join(directory, 'profiles'))
+
+    def write_profiles(files):
+        for file in os.listdir(os.path.join(directory, 'profiles')):
+            if f'profiles/{file}' not in files:
+                os.remove(os.path.join(directory, 'profiles', file))
+        for name, contents in files.items():
+            if name == 'config.yaml':
+                contents = yaml.dump(offline_config(yaml.load(contents, yaml.SafeLoader))).encode('utf-8')
+            with open(os.path.join(directory, name), 'wb') as file:
+                file.write(contents)
+
+    write_profiles(backend.profiles())
+    app = AudioManager(backend=backend, tray=False, config_path=os.path.join(directory, 'config.yaml'),
+                       profiles_path=os.path.join(directory, 'profiles'), trace_path=output_path, journal_path=None,
+                       checkpoint_path=None)
+
+    def change_profiles(files):
+        write_profiles(files)
+        app.profile_watcher.reload(force=True)
+
+    backend.on_profiles = change_profiles
+    backend.on_device = app.device_watcher.update
+    # only the state, the microphone is not switched in a replay
+    backend.on_hear_through = lambda enabled: setattr(app, 'hear_through_enabled', enabled)
+    backend.ready.set()
+    backend.finished.wait()
+    # before stopping, which waits for the threads and servers
+    report = backend.report()
+    app.stop()
+    print(report)
+    differences = compare(trace_path, output_path)
+    for snapshot, expected, actual in differences[:10]:
+        print(f"Snapshot {snapshot}: recorded {expected}, replayed {actual}")
+    print(f"{len(differences)} of {backend.snapshots} snapshots with different decisions")
+    return 1 if differences else 0
 
 if __name__ == "__main__":
+    trace_path = sys.argv[sys.argv.index("--record") + 1] if "--record" in sys.argv else None
     if "--audiosessions" in sys.argv:
-        sessions = AudioUtilities.GetAllSessions()
-        for session in sessions:
-            try: print(session.Process.name(), session.State)
-            except: print(session.DisplayName, session.State)
+        backend = create_backend()
+        backend.initialize_thread()
+        backend.start(ProfileCompiler('./config/config.yaml', './profiles').compile())
+        for session in backend.get_audio_sessions():
+            print(get_session_name(session), session.State)
+    elif "--replay" in sys.argv:
+        trace = sys.argv[sys.argv.index("--replay") + 1]
+        sys.exit(replay(trace, sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else f"{trace}.replay"))
+    elif "--headless" in sys.argv:
+        headless(trace_path)
+    elif "--startup-report" in sys.argv:
+        budget = float(sys.argv[sys.argv.index("--budget") + 1]) if "--budget" in sys.argv else 500
+        sys.exit(startup_report(budget))
+    elif "--simulate" in sys.argv:
+        duration = float(sys.argv[sys.argv.index("--duration") + 1]) if "--duration" in sys.argv else 60
+        simulate(int(sys.argv[sys.argv.index("--simulate") + 1]), duration)
     else:
-        main()
+        main(trace_path)
@@ -0,0 +1,212 @@
+"""
+    Detects which sink-inputs actually play sound by metering the peak levels of their monitor streams
+
+    Every metered sink-input gets one `parec --monitor-stream`, which delivers its samples downmixed to
+    mono at a low rate. A single thread collects the samples of all streams and computes their peaks
+    together with NumPy every interval. A sink-input becomes active as soon as its peak exceeds the
+    threshold, and inactive once it stayed below the release level for the hold time, so pauses between
+    songs or words don't change it. A corked (paused) stream delivers no samples and counts as silent.
+"""
+import logging
+import os
+import selectors
+import subprocess
+import time
+from threading import Lock, Thread
+
+from modules.metrics import metrics
+
+log = logging.getLogger("audiomanager")
+
+# samples per second and stream, the peaks only need a rough envelope of the signal
+RATE = 1000
+# bytes per sample, mono float32
+SAMPLE_SIZE = 4
+# level of silence in dBFS, instead of log10(0)
+SILENCE = -120.0
+
+
+class Meter:
+    __slots__ = ('index', 'process', 'buffer', 'active', 'quiet_since')
+
+    def __init__(self, index, process, now):
+        self.index = index
+        self.process = process
+        self.buffer = bytearray()
+        # None until the first decision, the sink-input counts as active until then
+        self.active = None
+        self.quiet_since = now
+
+
+class ActivityDetector:
+    def __init__(self, server=None, on_change=None, threshold=-45, release=-55, hold=2, interval=.1):
+        """
+        :param server: address of the sound server, None for the default server
+        :param on_change: callable run after metered sink-inputs became active or inactive
+        :param threshold: peak level in dBFS above which a sink-input is active
+        :param release: peak level in dBFS below which an active sink-input becomes inactive after the hold time
+        :param hold: seconds below the release level before a sink-input is inactive
+        :param interval: seconds between two meterings
+        """
+        self.server = server
+        self.on_change = on_change
+        self.threshold = threshold
+        self.release = release
+        self.hold = hold
+        self.interval = interval
+        self.keep_alive = True
+        # sink-input index -> Meter
+        self.meters = {}
+        # sink-inputs whose monitor stream ended, the sound server does not reuse their indices
+        self.__ended = set()
+        # sink-inputs to meter
+        self.__watched = frozenset()
+        self.__lock = Lock()
+        self.__numpy = None
+        self.__selector = None
+
+    def start(self):
+        try:
+            import numpy
+        except ImportError:
+            log.info("numpy is not installed, activity detection is disabled.")
+            return
+        self.__numpy = numpy
+        self.__selector = selectors.DefaultSelector()
+        Thread(target=self.__run, daemon=True).start()
+
+    def stop(self):
+        self.keep_alive = False
+
+    def watch(self, indices):
+        """
+        meters exactly these sink-inputs from the next interval on
+        :param indices: indices of the sink-inputs
+        :return:
+        """
+        self.__watched = frozenset(indices)
+
+    def is_active(self, index):
+        """
+        :param index: index of the sink-input
+        :return: True if the sink-input plays sound, None if that is not known (yet or at all)
+        """
+        meter = self.meters.get(index)
+        return meter.active if meter is not None else None
+
+    def __run(self):
+        next_metering = time.monotonic()
+        while self.keep_alive:
+            timeout = max(0.0, next_metering - time.monotonic())
+            if self.__selector.get_map():
+                events = self.__selector.select(timeout)
+            else:
+                events = ()
+                time.sleep(timeout)
+            for key, mask in events:
+                self.__read(key.data)
+            now = time.monotonic()
+            if now >= next_metering:
+                next_metering = now + self.interval
+                with metrics.phase_latency.time('meter'):
+                    changed = self.__measure(now)
+                self.__maintain(now)
+                if changed and self.on_change is not None:
+                    self.on_change()
+        for meter in list(self.meters.values()):
+            self.__close(meter)
+
+    def __read(self, meter):
+        try:
+            data = os.read(meter.process.stdout.fileno(), 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if data:
+            meter.buffer += data
+            return
+        # parec exits when the sink-input is gone
+        if len(self.__ended) >= 4096:
+            self.__ended.clear()
+        self.__ended.add(meter.index)
+        self.__close(meter)
+
+    def __measure(self, now):
+        """
+        computes the peaks of the samples received since the last metering and updates the activity
+        :return: True if a sink-input became active or inactive
+        """
+        numpy = self.__numpy
+        with self.__lock:
+            meters = list(self.meters.values())
+        chunks = []
+        lengths = []
+        for meter in meters:
+            usable = len(meter.buffer) - len(meter.buffer) % SAMPLE_SIZE
+            lengths.append(usable // SAMPLE_SIZE)
+            if usable:
+                chunks.append(bytes(meter.buffer[:usable]))
+                del meter.buffer[:usable]
+        levels = numpy.full(len(meters), SILENCE)
+        if chunks:
+            samples = numpy.abs(numpy.frombuffer(b''.join(chunks), dtype=numpy.float32))
+            lengths = numpy.array(lengths)
+            received = lengths > 0
+            # one reduction over the samples of all streams, each stream starts at its offset
+            offsets = numpy.concatenate(([0], numpy.cumsum(lengths[received])[:-1]))
+            peaks = numpy.maximum.reduceat(samples, offsets)
+            levels[received] = 20 * numpy.log10(numpy.maximum(peaks, 10 ** (SILENCE / 20)))
+
+        changed = False
+        with self.__lock:
+            for meter, level in zip(meters, levels.tolist()):
+                if level >= self.threshold or (meter.active and level >= self.release):
+                    meter.quiet_since = None
+                    active = True
+                else:
+                    if meter.quiet_since is None:
+                        meter.quiet_since = now
+                    active = False if now - meter.quiet_since >= self.hold else meter.active
+                if active != meter.active:
+                    log.debug("Sink-input %s is %s (%.0f dBFS)", meter.index, 'active' if active else 'inactive', level)
+                    meter.active = active
+                    changed = True
+        return changed
+
+    def __maintain(self, now):
+        """
+        starts metering the watched sink-inputs and stops metering the ones not watched anymore
+        """
+        watched = self.__watched
+        for meter in [meter for meter in self.meters.values() if meter.index not in watched]:
+            self.__close(meter)
+        for index in watched:
+            if index not in self.meters and index not in self.__ended and self.keep_alive:
+                self.__open(index, now)
+
+    def __open(self, index, now):
+        command = ['parec'] if self.server is None else ['parec', '--server', self.server]
+        command += [f'--monitor-stream={index}', '--format=float32le', f'--rate={RATE}', '--channels=1',
+                    '--latency-msec=100', '--client-name=audiomanager', '--stream-name=activity']
+        try:
+            metrics.subprocess_spawns.inc('parec')
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            log.info("parec not found, activity detection is disabled.")
+            self.keep_alive = False
+            return
+        meter = Meter(index, process, now)
+        os.set_blocking(process.stdout.fileno(), False)
+        self.__selector.register(process.stdout, selectors.EVENT_READ, meter)
+        with self.__lock:
+            self.meters[index] = meter
+
+    def __close(self, meter):
+        with self.__lock:
+            self.meters.pop(meter.index, None)
+        self.__selector.unregister(meter.process.stdout)
+        if meter.process.poll() is None:
+            meter.process.terminate()
+        meter.process.wait()
+        meter.process.stdout.close()
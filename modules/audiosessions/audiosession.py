@@ -1,12 +1,39 @@
+import sys
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class Process:
+    __slots__ = ('name', 'id')
+
     def __init__(self, process_name, process_id) -> None:
-        self.name = process_name
+        self.name = intern(process_name)
         self.id = process_id
 
 class AudioSession:
-    def __init__(self, name, process, process_id, state, current_volume):
+    # created for every sink-input, so without a __dict__ and with the names shared between sessions
+    __slots__ = ('name', 'Process', 'State', 'current_volume', 'channel_volumes', 'DisplayName')
+
+    def __init__(self, name, process, process_id, state, current_volume, channel_volumes=None):
+        process = intern(process)
         self.name = process
         self.Process = Process(process, process_id)
         self.State = state
         self.current_volume = current_volume
+        self.channel_volumes = channel_volumes if channel_volumes is not None else (current_volume,)
         self.DisplayName = process
+
+    def assign(self, other):
+        """
+        takes over the values of a newer enumeration of the same session, so the session keeps its identity
+        :param other: AudioSession with the same id
+        :return:
+        """
+        self.name = other.name
+        self.Process.name = other.Process.name
+        self.State = other.State
+        self.current_volume = other.current_volume
+        self.channel_volumes = other.channel_volumes
+        self.DisplayName = other.DisplayName
@@ -0,0 +1,209 @@
+"""
+    Matches the names of all profile entries against the audio sessions in a single pass
+"""
+import fnmatch
+import logging
+import re
+
+log = logging.getLogger("audiomanager")
+
+def get_session_name(session):
+    """
+    :param session: pycaw AudioSession on Windows, AudioSession on Linux
+    :return: lowercase name of the session or None
+    """
+    try:
+        try:
+            session_name = session.Process.name()
+        except:
+            session_name = session.DisplayName
+        return session_name.lower()
+    except AttributeError as e:
+        log.debug("AttributeError while adding session for matching")
+        log.debug(e)
+        return None
+
+
+class SessionMatcher:
+    def __init__(self, patterns):
+        """
+        compiles the profile entries once, entries may be prefixed with a match mode:
+        "exact:<name>", "glob:<pattern>" or "re:<regex>", all other entries match as substring
+        :param patterns: names used in the profiles
+        """
+        self.patterns = frozenset(patterns)
+        # lowercase session name -> matching profile entries, most sessions keep their name for their lifetime
+        self.names = {}
+        self.exact = {}
+        self.expressions = []
+        substrings = {}
+        for pattern in self.patterns:
+            if pattern.startswith('exact:'):
+                self.exact.setdefault(pattern[len('exact:'):].lower(), []).append(pattern)
+            elif pattern.startswith('glob:'):
+                self.expressions.append((pattern, re.compile(fnmatch.translate(pattern[len('glob:'):].lower())).match))
+            elif pattern.startswith('re:'):
+                self.expressions.append((pattern, re.compile(pattern[len('re:'):], re.IGNORECASE).search))
+            else:
+                substrings.setdefault(pattern.lower(), []).append(pattern)
+        self.__build_automaton(substrings)
+
+    def __build_automaton(self, substrings):
+        """
+        Aho-Corasick automaton over all substring patterns
+        :param substrings: dict lowercase substring -> profile entries
+        :return:
+        """
+        self.goto = [{}]
+        self.output = [[]]
+        for substring, patterns in substrings.items():
+            state = 0
+            for character in substring:
+                if character not in self.goto[state]:
+                    self.goto.append({})
+                    self.output.append([])
+                    self.goto[state][character] = len(self.goto) - 1
+                state = self.goto[state][character]
+            self.output[state].extend(patterns)
+
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for character, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and character not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(character, 0) if state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def match_name(self, name):
+        """
+        :param name: lowercase session name
+        :return: set of all profile entries matching the name
+        """
+        matched = set(self.exact.get(name, ()))
+        state = 0
+        for character in name:
+            while state and character not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(character, 0)
+            matched.update(self.output[state])
+        for pattern, expression in self.expressions:
+            if expression(name):
+                matched.add(pattern)
+        return matched
+
+    def match_cached(self, name):
+        """
+        :param name: lowercase session name
+        :return: frozenset of all profile entries matching the name
+        """
+        matched = self.names.get(name)
+        if matched is None:
+            if len(self.names) >= 16384:
+                # bounds the memory with ever changing names, e.g. with the pid in them
+                self.names.clear()
+            matched = self.names[name] = frozenset(self.match_name(name))
+        return matched
+
+    def index(self, records):
+        """
+        :param records: SessionRecords of the current sessions
+        :return: SessionIndex
+        """
+        return SessionIndex(records, self)
+
+
+class SessionIndex:
+    def __init__(self, records, matcher):
+        """
+        resolves all profile entries for the sessions of a SessionTable, kept up to date with its deltas
+        :param records: SessionRecords of the current sessions
+        :param matcher: SessionMatcher
+        """
+        self.matcher = matcher
+        # key -> SessionRecord of the sessions with a name
+        self.records = {}
+        # key -> profile entries matching the session
+        self.session_patterns = {}
+        # profile entry -> {key: SessionRecord} of all matching sessions
+        self.candidates = {}
+        self.matches = {}
+        dirty = set()
+        for record in records:
+            self.__add(record, dirty)
+        self.__select_all(dirty)
+
+    def update(self, delta):
+        """
+        takes over the changes of the sessions, only the profile entries matching changed sessions are resolved again
+        :param delta: SessionDelta of the SessionTable the index was built from
+        :return:
+        """
+        dirty = set()
+        for record in delta.removed:
+            self.__remove(record.key, dirty)
+        for record in delta.changed:
+            if record.name is not None and record.key in self.records and \
+                    self.matcher.match_cached(record.name) == self.session_patterns[record.key]:
+                # the state or the session object changed
+                dirty.update(self.session_patterns[record.key])
+            else:
+                self.__remove(record.key, dirty)
+                self.__add(record, dirty)
+        for record in delta.added:
+            self.__add(record, dirty)
+        self.__select_all(dirty)
+
+    def __add(self, record, dirty):
+        if record.name is None:
+            return
+        self.records[record.key] = record
+        patterns = self.session_patterns[record.key] = self.matcher.match_cached(record.name)
+        for pattern in patterns:
+            self.candidates.setdefault(pattern, {})[record.key] = record
+        dirty.update(patterns)
+
+    def __remove(self, key, dirty):
+        if self.records.pop(key, None) is None:
+            return
+        patterns = self.session_patterns.pop(key)
+        for pattern in patterns:
+            candidates = self.candidates[pattern]
+            del candidates[key]
+            if not candidates:
+                del self.candidates[pattern]
+        dirty.update(patterns)
+
+    def __select_all(self, patterns):
+        for pattern in patterns:
+            candidates = self.candidates.get(pattern)
+            if candidates:
+                self.matches[pattern] = self.__select(candidates.values())
+            else:
+                self.matches.pop(pattern, None)
+
+    @staticmethod
+    def __select(records):
+        # if multiple sessions, return the first active session or the last session in the order of the enumeration
+        selected = None
+        for record in records:
+            if record.session.State == 1:
+                if selected is None or selected.session.State != 1 or record.order < selected.order:
+                    selected = record
+            elif selected is None or selected.session.State != 1 and record.order > selected.order:
+                selected = record
+        return selected.session
+
+    def get(self, pattern):
+        """
+        :param pattern: profile entry
+        :return: the matching session or False
+        """
+        if pattern not in self.matcher.patterns:
+            # not part of the profiles (e.g. the capture card), match it on its own
+            matcher = SessionMatcher([pattern])
+            matched_records = [record for record in self.records.values() if matcher.match_name(record.name)]
+            return self.__select(matched_records) if matched_records else False
+        return self.matches.get(pattern, False)
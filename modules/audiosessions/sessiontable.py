@@ -0,0 +1,139 @@
+"""
+    The audio sessions of the last enumeration keyed by their identity (the sink-input index on Linux)
+
+    Sessions are updated in place from every new enumeration, and each update reports which sessions were
+    added, removed or changed, so the matching only has to look at those.
+"""
+import logging
+import sys
+
+from modules.audiosessions.audiosession import AudioSession
+from modules.audiosessions.sessionmatcher import get_session_name
+
+log = logging.getLogger("audiomanager")
+
+
+class SessionRecord:
+    __slots__ = ('key', 'session', 'order', 'name', 'display_name', 'state')
+
+    def __init__(self, key, session, order):
+        self.key = key
+        self.session = session
+        # position of the session in the enumerations, increasing with every new session
+        self.order = order
+        self.name = None
+        self.display_name = None
+        self.state = None
+        self.refresh(True)
+
+    def refresh(self, replaced):
+        """
+        reads the name and state of the session again
+        :param replaced: True if the session object is a new one, its name is looked up again then
+        :return: True if the name or the state changed
+        """
+        session = self.session
+        display_name = session.DisplayName
+        state = session.State
+        if not replaced and display_name is self.display_name and state == self.state:
+            return False
+        name = get_session_name(session)
+        if name is not None:
+            name = sys.intern(name)
+        changed = name != self.name or state != self.state
+        self.name = name
+        self.display_name = display_name
+        self.state = state
+        return changed
+
+
+class SessionDelta:
+    __slots__ = ('added', 'removed', 'changed')
+
+    def __init__(self):
+        # SessionRecords, removed ones as they were before the update
+        self.added = []
+        self.removed = []
+        self.changed = []
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+class SessionTable:
+    def __init__(self, get_key=lambda session: session.Process.id):
+        """
+        :param get_key: callable returning the hashable identity of a session
+        """
+        self.get_key = get_key
+        # key -> SessionRecord, in the order the sessions appeared
+        self.records = {}
+        self.__added = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        """
+        :return: iterator over the sessions
+        """
+        return (record.session for record in self.records.values())
+
+    @property
+    def sessions(self):
+        """
+        :return: list of the sessions
+        """
+        return [record.session for record in self.records.values()]
+
+    def update(self, sessions):
+        """
+        takes over a new enumeration, AudioSessions of known keys are updated in place
+        :param sessions: all current sessions
+        :return: SessionDelta to the previous enumeration, changes of only the volume are left out,
+                 sessions which are new objects of a known key (e.g. pycaw sessions) count as changed
+        """
+        delta = SessionDelta()
+        records = self.records
+        keys = set()
+        for session in sessions:
+            key = self.get_key(session)
+            if key in keys:
+                # sessions sharing a key (e.g. one process with several sessions on Windows) are told apart by order
+                occurrence = 1
+                while (key, occurrence) in keys:
+                    occurrence += 1
+                key = (key, occurrence)
+            keys.add(key)
+            record = records.get(key)
+            if record is None:
+                self.__added += 1
+                record = records[key] = SessionRecord(key, session, self.__added)
+                delta.added.append(record)
+            elif record.session is session:
+                if record.refresh(False):
+                    delta.changed.append(record)
+            else:
+                if type(session) is AudioSession and type(record.session) is AudioSession:
+                    record.session.assign(session)
+                    replaced = False
+                else:
+                    record.session = session
+                    replaced = True
+                if record.refresh(replaced) or replaced:
+                    delta.changed.append(record)
+        if len(records) != len(keys):
+            for key in [key for key in records if key not in keys]:
+                delta.removed.append(records.pop(key))
+        return delta
+
+    def remove(self, key):
+        """
+        :param key: key of a session which is gone
+        :return: SessionDelta with the removed session, empty if it was not known
+        """
+        delta = SessionDelta()
+        record = self.records.pop(key, None)
+        if record is not None:
+            delta.removed.append(record)
+        return delta
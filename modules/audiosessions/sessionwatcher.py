@@ -0,0 +1,151 @@
+"""
+    Keeps track of the sink-inputs of the sound server through one long lived `pactl subscribe`
+"""
+import logging
+import subprocess
+import time
+from threading import Event, Lock, Thread
+
+from modules.audiosessions.sessiontable import SessionTable
+from modules.metrics import metrics
+
+log = logging.getLogger("audiomanager")
+
+
+class SessionWatcher:
+    def __init__(self, enumerate_sessions, resync_interval=30, debounce=0.05, server=None, on_device_event=None):
+        """
+        :param enumerate_sessions: callable returning the current list of AudioSessions
+        :param resync_interval: seconds between full resyncs, catches events which got lost
+        :param debounce: seconds to wait after an event, so bursts only cause one enumeration
+        :param server: address of the sound server, None for the default server
+        :param on_device_event: callable run on server and sink events, which may change the default sink
+        """
+        self.enumerate_sessions = enumerate_sessions
+        self.server = server
+        self.on_device_event = on_device_event
+        self.resync_interval = resync_interval
+        self.debounce = debounce
+        self.keep_alive = True
+        self.changed = Event()
+        # updated in place, so the sessions keep their identity across resyncs
+        self.__table = SessionTable()
+        self.__dirty = Event()
+        self.__lock = Lock()
+        self.__process = None
+        self.__enumeration_failed = False
+
+    def start(self):
+        self.__resync()
+        Thread(target=self.__listen, daemon=True).start()
+        Thread(target=self.__sync, daemon=True).start()
+
+    def stop(self):
+        self.keep_alive = False
+        self.__dirty.set()
+        if self.__process is not None:
+            self.__process.terminate()
+
+    @property
+    def sessions(self):
+        """
+        :return: list of the currently known sessions
+        """
+        with self.__lock:
+            return self.__table.sessions
+
+    def wait(self, timeout):
+        """
+        blocks until the set of sessions changed in a way relevant for the volume rules
+        :param timeout: seconds to wait at most
+        :return: True if the sessions changed since the last call
+        """
+        changed = self.changed.wait(timeout)
+        self.changed.clear()
+        return changed
+
+    def __listen(self, retry_delay=1, max_retry_delay=60):
+        """
+        :param retry_delay: seconds to wait before resubscribing after the subscription exited
+        :param max_retry_delay: seconds the delay doubles up to while the subscription keeps failing,
+                                e.g. while the sound server can't be reached
+        """
+        delay = retry_delay
+        while self.keep_alive:
+            try:
+                command = ['pactl', 'subscribe'] if self.server is None else ['pactl', '--server', self.server, 'subscribe']
+                metrics.subprocess_spawns.inc('pactl')
+                self.__process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                                  stderr=subprocess.DEVNULL, text=True, bufsize=1)
+            except FileNotFoundError:
+                log.info("pactl not found, falling back to periodic resyncs.")
+                return
+            started = time.monotonic()
+            received = False
+            for line in self.__process.stdout:
+                received = True
+                self.__handle_event(line)
+            self.__process.wait()
+            if not self.keep_alive:
+                return
+            if received or time.monotonic() - started > max_retry_delay:
+                # the subscription worked, this is a new failure
+                delay = retry_delay
+            # the subscription died (e.g. sound server restart), resync and resubscribe,
+            # only the first of consecutive failures is logged
+            if delay == retry_delay:
+                log.info("pactl subscribe exited, resubscribing.")
+            else:
+                log.debug("pactl subscribe exited again, resubscribing in %s s", delay)
+            self.__dirty.set()
+            time.sleep(delay)
+            delay = min(delay * 2, max_retry_delay)
+
+    def __handle_event(self, line):
+        """
+        handles lines like "Event 'new' on sink-input #42"
+        :param line:
+        :return:
+        """
+        parts = line.split()
+        if len(parts) >= 4 and parts[3] in ('server', 'sink') and self.on_device_event is not None:
+            self.on_device_event()
+            return
+        if len(parts) != 5 or parts[3] != 'sink-input':
+            return
+        event = parts[1].strip("'")
+        index = parts[4].lstrip('#')
+        if event == 'remove':
+            with self.__lock:
+                delta = self.__table.remove(index)
+            if delta:
+                self.changed.set()
+        else:
+            self.__dirty.set()
+
+    def __sync(self):
+        while self.keep_alive:
+            self.__dirty.wait(self.resync_interval)
+            if not self.keep_alive:
+                return
+            time.sleep(self.debounce)
+            self.__dirty.clear()
+            self.__resync()
+
+    def __resync(self):
+        try:
+            sessions = self.enumerate_sessions()
+        except Exception as err:
+            # only the first of consecutive failures is logged, e.g. while the sound server can't be reached
+            if self.__enumeration_failed:
+                log.debug("Failed to enumerate audio sessions: %s", err)
+            else:
+                log.info(f"Failed to enumerate audio sessions: {err}")
+            self.__enumeration_failed = True
+            return
+        self.__enumeration_failed = False
+        with self.__lock:
+            # volume changes are left out, they are mostly caused by our own fades
+            delta = self.__table.update(sessions)
+        if delta:
+            self.changed.set()
@@ -0,0 +1,165 @@
+"""
+    Interface between the control loop and the audio system of the platform
+"""
+import platform
+import time
+from threading import Event
+
+
+def create_backend(server=None):
+    """
+    :param server: address of a PulseAudio/PipeWire server (like PULSE_SERVER), None for the local audio system
+    :return: the backend for the current platform
+    """
+    if server is not None:
+        from modules.backends.linuxbackend import LinuxBackend
+        return LinuxBackend(server)
+    if platform.system() == "Windows":
+        from modules.backends.windowsbackend import WindowsBackend
+        return WindowsBackend()
+    elif platform.system() == "Linux":
+        from modules.backends.linuxbackend import LinuxBackend
+        return LinuxBackend()
+    raise RuntimeError(f"Unsupported platform: {platform.system()}")
+
+
+class VolumeWriteError(Exception):
+    def __init__(self, sessions):
+        """
+        raised by set_app_volumes after the volumes of some sessions could not be set, the others were set
+        :param sessions: list of the sessions whose volume was not set
+        """
+        super().__init__(f"{len(sessions)} volumes could not be set")
+        self.sessions = sessions
+
+
+class AudioBackend:
+    # process carrying the audio of the capture card, None if not supported
+    capture_card_process = None
+    # True for backends on a virtual clock, they report the time passing to on_advance
+    virtual_time = False
+
+    def __init__(self):
+        self.wakeup = Event()
+        # callable getting the virtual seconds passed, for backends with virtual_time
+        self.on_advance = None
+
+    def start(self, profile_table):
+        """
+        connects to the audio system
+        :param profile_table: ProfileTable loaded at startup
+        :return:
+        """
+        pass
+
+    def stop(self):
+        pass
+
+    def initialize_thread(self):
+        """
+        prepares a thread which accesses audio sessions
+        :return:
+        """
+        pass
+
+    def get_audio_sessions(self):
+        """
+        :return: list of the current audio sessions
+        """
+        raise NotImplementedError
+
+    def wait_for_sessions(self, timeout):
+        """
+        waits until the audio sessions changed, backends without change notifications just wait
+        :param timeout: seconds to wait at most
+        :return: True if the audio sessions (may have) changed
+        """
+        self.wakeup.wait(timeout)
+        self.wakeup.clear()
+        return True
+
+    def wake(self):
+        """
+        ends a running wait_for_sessions early, e.g. after a setting was toggled
+        :return:
+        """
+        self.wakeup.set()
+
+    def get_session_key(self, audio_session):
+        """
+        :param audio_session:
+        :return: hashable identity of the session
+        """
+        return audio_session.Process.id
+
+    def get_app_volume(self, audio_session):
+        """
+        :param audio_session:
+        :return: current volume of the session or None if it can't be read
+        """
+        raise NotImplementedError
+
+    def is_session_active(self, audio_session):
+        """
+        :param audio_session:
+        :return: True if the session is playing audio and not muted
+        """
+        return bool(audio_session.State)
+
+    def watch_activity(self, audio_sessions):
+        """
+        backends which can tell whether a session actually plays sound check only these sessions that way
+        in is_session_active, the activity of the watched applications decides the target volumes
+        :param audio_sessions: sessions of the watched applications
+        :return:
+        """
+        pass
+
+    def set_app_volumes(self, volumes):
+        """
+        sets as many volumes as possible, a session which can't be set (e.g. it is gone) does not stop the others
+        :param volumes: list of (audio_session, volume)
+        :return:
+        :raises VolumeWriteError: with the sessions which could not be set
+        """
+        raise NotImplementedError
+
+    def set_microphone_gain(self, gain):
+        """
+        :param gain: gain of the default microphone, 65535 is 100%
+        :return:
+        """
+        pass
+
+    def get_default_output(self):
+        """
+        :return: name of the default output device or None
+        """
+        return None
+
+    def wait_for_device_change(self, timeout):
+        """
+        waits until the default output device changed, backends without change notifications just wait
+        :param timeout: seconds to wait at most
+        :return: True if the default output device (may have) changed
+        """
+        time.sleep(timeout)
+        return True
+
+    def set_hear_through(self, microphone_name, enabled):
+        pass
+
+    def play_pause(self):
+        """
+        presses the play/pause media key
+        :return:
+        """
+        import pyautogui
+        pyautogui.press('playpause')
+
+    def toggle_mute(self):
+        """
+        mutes or unmutes the default output device
+        :return:
+        """
+        raise NotImplementedError
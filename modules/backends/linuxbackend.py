@@ -0,0 +1,104 @@
+"""
+    Audio backend for Linux through PulseAudio/PipeWire
+"""
+import logging
+from threading import Event
+
+from modules.activitydetector.activitydetector import ActivityDetector
+from modules.audiosessions.sessionwatcher import SessionWatcher
+from modules.backends.audiobackend import AudioBackend, VolumeWriteError
+from modules.pulseaudio import pulseconnection
+from modules.pulseaudio.pactlparser import VOLUME_NORM
+
+log = logging.getLogger("audiomanager")
+
+
+class LinuxBackend(AudioBackend):
+    def __init__(self, server=None):
+        """
+        :param server: address of the sound server, None for the default server
+        """
+        super().__init__()
+        self.server = server
+        self.pulse = None
+        self.session_watcher = None
+        self.activity_detector = None
+        self.device_event = Event()
+
+    def start(self, profile_table):
+        self.pulse = pulseconnection.connect(self.server)
+        self.session_watcher = SessionWatcher(self.pulse.sink_inputs, server=self.server,
+                                              on_device_event=self.device_event.set,
+                                              resync_interval=profile_table.config.get('session_resync_interval', 30))
+        self.session_watcher.start()
+        activity_detection = profile_table.config.get('activity_detection') or {}
+        if activity_detection.get('enabled'):
+            # a session which starts or stops playing sound is handled like a changed session
+            self.activity_detector = ActivityDetector(self.server, on_change=self.wake,
+                                                      threshold=activity_detection.get('threshold', -45),
+                                                      release=activity_detection.get('release', -55),
+                                                      hold=activity_detection.get('hold', 2))
+            self.activity_detector.start()
+
+    def stop(self):
+        self.session_watcher.stop()
+        if self.activity_detector is not None:
+            self.activity_detector.stop()
+        self.pulse.close()
+
+    def get_audio_sessions(self):
+        return self.session_watcher.sessions
+
+    def wait_for_sessions(self, timeout):
+        return self.session_watcher.wait(timeout)
+
+    def wake(self):
+        self.session_watcher.changed.set()
+
+    def get_default_output(self):
+        return self.pulse.default_sink()
+
+    def wait_for_device_change(self, timeout):
+        changed = self.device_event.wait(timeout)
+        self.device_event.clear()
+        return changed
+
+    def get_app_volume(self, audio_session):
+        return audio_session.current_volume
+
+    def is_session_active(self, audio_session):
+        # State is False for muted and corked (paused) sink-inputs
+        if not audio_session.State:
+            return False
+        if self.activity_detector is None:
+            return True
+        active = self.activity_detector.is_active(audio_session.Process.id)
+        # sessions which are not metered (yet) count as active
+        return active is not False
+
+    def watch_activity(self, audio_sessions):
+        if self.activity_detector is not None:
+            self.activity_detector.watch(audio_session.Process.id for audio_session in audio_sessions)
+
+    def set_app_volumes(self, volumes):
+        failed = []
+        for audio_session, volume in volumes:
+            try:
+                self.pulse.set_sink_input_volume(audio_session.Process.id, volume)
+            except Exception as err:
+                # e.g. the sink-input ended since the last enumeration
+                log.debug("Failed to set the volume of sink-input %s: %s", audio_session.Process.id, err)
+                failed.append(audio_session)
+        if failed:
+            raise VolumeWriteError(failed)
+
+    def set_microphone_gain(self, gain):
+        # the gains in the profiles are on the scale of nircmd (65535 is 100%), like PulseAudio volumes,
+        # nircmd caps them at 100%, above that PulseAudio would amplify in software
+        try:
+            self.pulse.set_default_source_volume(min(max(gain / VOLUME_NORM, 0.0), 1.0))
+        except Exception as err:
+            log.info(f"Failed to set the microphone gain: {err}")
+
+    def toggle_mute(self):
+        self.pulse.toggle_default_sink_mute()
@@ -0,0 +1,120 @@
+"""
+    Audio backend replaying the sessions of a recorded trace at full speed, without a sound server
+
+    Waiting for sessions delivers the next recorded change: a session snapshot, a profile change (handed
+    to on_profiles), a device change (handed to on_device) and/or a hear through change (handed to
+    on_hear_through), in the thread of the control loop.
+"""
+import logging
+import time
+from threading import Event
+
+from modules.audiosessions.audiosession import AudioSession
+from modules.backends.audiobackend import AudioBackend
+from modules.trace.trace import read_trace
+
+log = logging.getLogger("audiomanager")
+
+
+class ReplayBackend(AudioBackend):
+    def __init__(self, path):
+        """
+        :param path: trace file written by a TraceRecorder
+        """
+        super().__init__()
+        self.records = [record for record in read_trace(path) if record[0] != 'T']
+        self.position = 0
+        self.sessions = []
+        self.output = None
+        self.snapshots = 0
+        self.writes = 0
+        self.finished = Event()
+        # callables for changes after the first snapshot, the replay waits for ready until they are set
+        self.ready = Event()
+        self.on_profiles = None
+        self.on_device = None
+        self.on_hear_through = None
+        self.__started = None
+
+    def profiles(self):
+        """
+        :return: the first recorded contents of the config and profile files
+        """
+        for kind, timestamp, payload in self.records:
+            if kind == 'P':
+                return payload
+        raise ValueError("The trace contains no profiles")
+
+    def start(self, profile_table):
+        # the first snapshot is the one enumerated before the control loop starts, like when it was recorded
+        self.__advance()
+        self.__started = (time.perf_counter(), time.process_time())
+
+    def stop(self):
+        self.finished.set()
+
+    def get_audio_sessions(self):
+        return self.sessions
+
+    def wait_for_sessions(self, timeout):
+        self.ready.wait()
+        if self.__advance():
+            return True
+        self.finished.set()
+        self.wakeup.wait(timeout)
+        self.wakeup.clear()
+        return False
+
+    def __advance(self):
+        """
+        applies the next recorded change, all records written for the same evaluation together
+        :return: False at the end of the trace
+        """
+        if self.position == len(self.records):
+            return False
+        timestamp = self.records[self.position][1]
+        profiles = None
+        device_changed = False
+        hear_through = None
+        while self.position < len(self.records) and self.records[self.position][1] == timestamp:
+            kind, timestamp, payload = self.records[self.position]
+            self.position += 1
+            if kind == 'P':
+                profiles = payload
+            elif kind == 'D':
+                self.output = payload
+                device_changed = True
+            elif kind == 'H':
+                hear_through = payload
+            elif kind == 'S':
+                self.sessions = [AudioSession(name=name, process=name, process_id=key, state=active,
+                                              current_volume=volume) for name, key, active, volume in payload]
+                self.snapshots += 1
+        if self.on_profiles is not None and profiles is not None:
+            self.on_profiles(profiles)
+        if self.on_device is not None and device_changed:
+            self.on_device()
+        if self.on_hear_through is not None and hear_through is not None:
+            self.on_hear_through(hear_through)
+        return True
+
+    def get_default_output(self):
+        return self.output
+
+    def get_app_volume(self, audio_session):
+        return audio_session.current_volume
+
+    def set_app_volumes(self, volumes):
+        self.writes += len(volumes)
+
+    def report(self):
+        """
+        :return: summary of the replay as text
+        """
+        wall_time = time.perf_counter() - self.__started[0]
+        cpu_time = time.process_time() - self.__started[1]
+        return "\n".join([
+            f"Replayed {self.snapshots} session snapshots in {wall_time:.2f} s "
+            f"({self.snapshots / wall_time:.0f} per second), volume writes: {self.writes}",
+            f"CPU time: {cpu_time:.2f} s",
+        ])
@@ -0,0 +1,151 @@
+"""
+    In-memory audio backend with synthetic sessions on a virtual clock, for load tests
+
+    Sessions start, mute, unmute and stop on a seeded random schedule. Waiting for sessions
+    jumps the virtual clock to the next scheduled change, so the control loop runs at full speed.
+"""
+import heapq
+import logging
+import statistics
+import time
+from random import Random
+from threading import Event, RLock
+
+from modules.audiosessions.audiosession import AudioSession
+from modules.backends.audiobackend import AudioBackend
+
+log = logging.getLogger("audiomanager")
+
+START, MUTE, UNMUTE, STOP = range(4)
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def advance_to(self, timestamp):
+        self.now = max(self.now, timestamp)
+
+
+class SimulatedBackend(AudioBackend):
+    virtual_time = True
+
+    def __init__(self, session_count, duration=60, seed=0, debounce=.05):
+        """
+        :param session_count: number of synthetic sessions
+        :param duration: virtual seconds to simulate
+        :param seed: seed of the schedule
+        :param debounce: virtual seconds of changes delivered together, like the session watcher
+        """
+        super().__init__()
+        self.session_count = session_count
+        self.duration = duration
+        self.debounce = debounce
+        self.clock = VirtualClock()
+        self.finished = Event()
+        self.random = Random(seed)
+        self.sessions = {}
+        self.schedule = []
+        self.names = []
+        self.changes = 0
+        self.writes = 0
+        self.latencies = []
+        self.__delivered = None
+        self.__started = None
+        # the volumes of transitions are set while the clock advances
+        self.__lock = RLock()
+
+    def start(self, profile_table):
+        # half of the sessions are named after profile entries, the other half is not controlled
+        # sorted, so the seed alone decides the schedule
+        self.names = sorted(name for name in set(profile_table.volume_profiles).union(*profile_table.volume_profiles.values())
+                            if ':' not in name and name not in ('standard', 'hear_through'))
+        for slot in range(self.session_count):
+            self.__schedule(self.random.uniform(0, self.duration / 4), START, slot)
+        self.__started = (time.perf_counter(), time.process_time())
+
+    def stop(self):
+        self.finished.set()
+
+    def __advance_clock(self, timestamp):
+        elapsed = timestamp - self.clock.now
+        self.clock.advance_to(timestamp)
+        if elapsed > 0 and self.on_advance is not None:
+            self.on_advance(elapsed)
+
+    def __schedule(self, timestamp, action, slot):
+        heapq.heappush(self.schedule, (timestamp, action, slot))
+
+    def __apply(self, action, slot):
+        session = self.sessions.get(slot)
+        if action == START:
+            name = self.random.choice(self.names) if self.names and slot % 2 == 0 else f"app{slot}"
+            self.sessions[slot] = AudioSession(name=name, process=name, process_id=str(slot), state=True,
+                                               current_volume=1)
+            self.__schedule(self.clock.now + self.random.uniform(2, 20), MUTE, slot)
+        elif action == MUTE:
+            session.State = False
+            self.__schedule(self.clock.now + self.random.uniform(1, 10), UNMUTE, slot)
+        elif action == UNMUTE:
+            session.State = True
+            self.__schedule(self.clock.now + self.random.uniform(2, 20),
+                            STOP if self.random.random() < .5 else MUTE, slot)
+        elif action == STOP:
+            del self.sessions[slot]
+            self.__schedule(self.clock.now + self.random.uniform(1, 30), START, slot)
+
+    def get_audio_sessions(self):
+        with self.__lock:
+            return list(self.sessions.values())
+
+    def wait_for_sessions(self, timeout):
+        if self.__delivered is not None:
+            # time the control loop needed to handle the previous change
+            self.latencies.append(time.perf_counter() - self.__delivered)
+            self.__delivered = None
+        if self.clock.now >= self.duration:
+            self.finished.set()
+        if self.finished.is_set():
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+            return False
+        deadline = min(self.clock.now + timeout, self.duration)
+        if not self.schedule or self.schedule[0][0] > deadline:
+            self.__advance_clock(deadline)
+            return False
+        with self.__lock:
+            until = self.schedule[0][0] + self.debounce
+            while self.schedule and self.schedule[0][0] <= until:
+                timestamp, action, slot = heapq.heappop(self.schedule)
+                self.__advance_clock(timestamp)
+                self.__apply(action, slot)
+                self.changes += 1
+        self.__delivered = time.perf_counter()
+        return True
+
+    def get_app_volume(self, audio_session):
+        return audio_session.current_volume
+
+    def set_app_volumes(self, volumes):
+        with self.__lock:
+            for audio_session, volume in volumes:
+                audio_session.current_volume = volume
+                self.writes += 1
+
+    def report(self):
+        """
+        :return: summary of the run as text
+        """
+        wall_time = time.perf_counter() - self.__started[0]
+        cpu_time = time.process_time() - self.__started[1]
+        latencies = sorted(self.latencies) or [0]
+        return "\n".join([
+            f"Simulated {self.session_count} sessions for {self.clock.now:.0f} virtual seconds",
+            f"Session changes: {self.changes}, evaluations: {len(self.latencies)}, volume writes: {self.writes}",
+            f"Loop latency: mean {statistics.mean(latencies)*1000:.2f} ms, "
+            f"p95 {latencies[int(len(latencies)*.95)]*1000:.2f} ms, max {latencies[-1]*1000:.2f} ms",
+            f"Wall time: {wall_time:.2f} s, CPU time: {cpu_time:.2f} s ({cpu_time/wall_time*100:.0f}%)",
+        ])
@@ -0,0 +1,75 @@
+"""
+    Audio backend for Windows through pycaw, nircmd and SoundVolumeView
+"""
+import logging
+import subprocess
+from ctypes import cast, POINTER
+
+import pythoncom
+import sounddevice
+from comtypes import CLSCTX_ALL
+from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+
+from modules.backends.audiobackend import AudioBackend, VolumeWriteError
+from modules.metrics import metrics
+
+log = logging.getLogger("audiomanager")
+
+
+class WindowsBackend(AudioBackend):
+    capture_card_process = "svchost.exe"
+
+    def initialize_thread(self):
+        pythoncom.CoInitialize()
+
+    def get_audio_sessions(self):
+        return AudioUtilities.GetAllSessions()
+
+    def get_session_key(self, audio_session):
+        return audio_session.ProcessId
+
+    def get_app_volume(self, audio_session):
+        try:
+            return round(audio_session.SimpleAudioVolume.GetMasterVolume(), 3)
+        except:
+            return None
+
+    def is_session_active(self, audio_session):
+        return bool(audio_session.State) and not audio_session.SimpleAudioVolume.GetMute()
+
+    def set_app_volumes(self, volumes):
+        failed = []
+        for audio_session, volume in volumes:
+            try:
+                audio_session.SimpleAudioVolume.SetMasterVolume(volume, None)
+            except Exception as err:
+                # e.g. the process ended since the last enumeration
+                log.debug("Failed to set the volume of process %s: %s", audio_session.ProcessId, err)
+                failed.append(audio_session)
+        if failed:
+            raise VolumeWriteError(failed)
+
+    def set_microphone_gain(self, gain):
+        # os.system(f"nircmdc.exe loop 1 250 setsysvolume {gain} default_record")
+        metrics.subprocess_spawns.inc('nircmdc')
+        try:
+            subprocess.call(f"nircmdc.exe loop 1 250 setsysvolume {gain} default_record", shell=True)
+        except PermissionError:
+            log.info("Error: Microphone access denied")
+
+    def get_default_output(self):
+        # PortAudio only notices a new default device after reinitialising
+        sounddevice._terminate()
+        sounddevice._initialize()
+        return str(sounddevice.query_devices(sounddevice.default.device[1]))
+
+    def set_hear_through(self, microphone_name, enabled):
+        metrics.subprocess_spawns.inc('SoundVolumeView')
+        subprocess.call(f'SoundVolumeView.exe /SetListenToThisDevice "{microphone_name}" {int(enabled)}', shell=True)
+
+    def toggle_mute(self):
+        pythoncom.CoInitialize()
+        devices = AudioUtilities.GetSpeakers()
+        interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
+        volume = cast(interface, POINTER(IAudioEndpointVolume))
+        volume.SetMute(not volume.GetMute(), None)
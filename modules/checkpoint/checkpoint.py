@@ -0,0 +1,100 @@
+"""
+    Checkpoints the state of the control loop to a small file, so a restarted instance continues where
+    the previous one stopped instead of fading every application again
+
+    The state is collected every interval and only written if it differs from the last written one, so
+    an idle instance does not write at all. The file is replaced atomically, a crash while writing leaves
+    the previous checkpoint.
+"""
+import json
+import logging
+import os
+from threading import Event, Lock, Thread
+
+log = logging.getLogger("audiomanager")
+
+# layout of the stored state, checkpoints of another layout are ignored
+VERSION = 1
+
+
+class Checkpointer:
+    def __init__(self, path, get_state, interval=1):
+        """
+        :param path: state file
+        :param get_state: callable returning the state as a dict of JSON types
+        :param interval: seconds between two checks whether the state changed
+        """
+        self.path = path
+        self.get_state = get_state
+        self.interval = interval
+        self.__stopped = Event()
+        self.__lock = Lock()
+        self.__thread = Thread(target=self.__run, daemon=True)
+        # state as last written, to skip writes of an unchanged state
+        self.__saved = None
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        """
+        ends the background checks, a check in progress is finished first
+        :return:
+        """
+        self.__stopped.set()
+        if self.__thread.is_alive():
+            self.__thread.join()
+
+    def save(self):
+        """
+        writes the current state if it changed since the last write
+        :return: True if the state was written
+        """
+        data = json.dumps({'version': VERSION, **self.get_state()}, separators=(',', ':'))
+        with self.__lock:
+            if data == self.__saved:
+                return False
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                file.write(data)
+            os.replace(temporary_path, self.path)
+            self.__saved = data
+        return True
+
+    def remove(self):
+        """
+        removes the state file, e.g. after the volumes were restored
+        :return:
+        """
+        with self.__lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.__saved = None
+
+    def __run(self):
+        while not self.__stopped.wait(self.interval):
+            try:
+                self.save()
+            except Exception as err:
+                log.info(f"Failed to write the checkpoint {self.path}: {err}")
+
+
+def load_checkpoint(path):
+    """
+    :param path: state file
+    :return: the stored state, None if there is none or it can't be used
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as err:
+        log.info(f"Failed to read the checkpoint {path}: {err}")
+        return None
+    if not isinstance(state, dict) or state.get('version') != VERSION:
+        log.info(f"Ignoring the checkpoint {path}, it has another layout")
+        return None
+    return state
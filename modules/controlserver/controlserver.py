@@ -0,0 +1,194 @@
+"""
+    HTTP API to read the state of the control loop, toggle settings and follow state changes
+
+    GET  /state            current state as JSON, {"hosts": {<name>: state}} when managing several sound servers
+    GET  /events           server-sent events, one "data:" line with the state per change
+    POST /toggles/<name>   toggles a setting or profile, answers with the new value
+    POST /<action>         runs an action like /playpause or /togglemute
+
+    Actions the backend does not support answer 501, toggles and actions which can't run yet (e.g. before
+    any sound server is managed) answer 503.
+"""
+import json
+import logging
+import queue
+from threading import Lock, Thread
+
+log = logging.getLogger("audiomanager")
+
+
+class NotReadyError(Exception):
+    """
+    raised by toggles and actions which can't run yet, but will once the control loop is up
+    """
+
+
+class ControlServer:
+    def __init__(self, toggle, actions, host='0.0.0.0', port=5000, keepalive=15):
+        """
+        :param toggle: callable getting the name of a setting, returns its new value or raises KeyError
+                       (unknown setting) or NotReadyError
+        :param actions: dict of action name -> callable
+        :param host: address to listen on
+        :param port: port to listen on
+        :param keepalive: seconds between keepalive comments on idle event streams
+        """
+        self.toggle = toggle
+        self.actions = actions
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        # host -> state, None is the only host when managing a single sound server
+        self.__states = {}
+        self.__body = None
+        # one queue per event stream, holding only the latest state a slow client has not sent yet
+        self.__clients = set()
+        self.__lock = Lock()
+        self.__server = None
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        control_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/state':
+                    self.__send(200, control_server.body())
+                elif path == '/events':
+                    self.__stream()
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                path = self.path.split('?')[0].strip('/')
+                try:
+                    if path.startswith('toggles/'):
+                        name = path[len('toggles/'):]
+                        try:
+                            value = control_server.toggle(name)
+                        except KeyError:
+                            self.send_error(404, f"Unknown setting {name}")
+                            return
+                        self.__send(200, json.dumps({name: value}).encode('utf-8'))
+                    elif path in control_server.actions:
+                        control_server.actions[path]()
+                        self.__send(200, b'{}')
+                    else:
+                        self.send_error(404)
+                except NotImplementedError:
+                    self.send_error(501)
+                except NotReadyError:
+                    self.send_error(503)
+                except Exception as err:
+                    log.info(f"Failed to handle {self.path}: {err}")
+                    self.send_error(500)
+
+            def __send(self, status, body):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def __stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                client = control_server.subscribe()
+                try:
+                    while True:
+                        try:
+                            body = client.get(timeout=control_server.keepalive)
+                        except queue.Empty:
+                            self.wfile.write(b': keepalive\n\n')
+                        else:
+                            if body is None:
+                                return
+                            self.wfile.write(b'data: ' + body + b'\n\n')
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    control_server.unsubscribe(client)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.__server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as err:
+            log.info(f"Failed to start the control server on port {self.port}: {err}")
+            return
+        self.__server.daemon_threads = True
+        Thread(target=self.__server.serve_forever, daemon=True).start()
+        log.info(f"Serving the control API on port {self.port}")
+
+    def stop(self):
+        with self.__lock:
+            for client in self.__clients:
+                self.__replace(client, None)
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+
+    def publish(self, state, host=None):
+        """
+        makes the state the current one and pushes it to the event streams if it changed
+        :param state: JSON serializable dict, must not be changed afterwards
+        :param host: name of the sound server the state belongs to, None if there is only one
+        :return:
+        """
+        with self.__lock:
+            if state == self.__states.get(host):
+                return
+            self.__states[host] = state
+            # serialized on the first read, no work for the control loop without clients
+            self.__body = None
+            if not self.__clients:
+                return
+            body = self.__serialize()
+            for client in self.__clients:
+                self.__replace(client, body)
+
+    def body(self):
+        """
+        :return: the current state as JSON
+        """
+        with self.__lock:
+            return self.__serialize()
+
+    def subscribe(self):
+        """
+        :return: queue getting the current state and every following one
+        """
+        client = queue.Queue(maxsize=1)
+        with self.__lock:
+            client.put_nowait(self.__serialize())
+            self.__clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self.__lock:
+            self.__clients.discard(client)
+
+    def __serialize(self):
+        if self.__body is None:
+            if None in self.__states or not self.__states:
+                state = self.__states.get(None, {})
+            else:
+                state = {'hosts': self.__states}
+            self.__body = json.dumps(state, sort_keys=True).encode('utf-8')
+        return self.__body
+
+    @staticmethod
+    def __replace(client, body):
+        """
+        puts the body into the queue of a client, dropping a state the client has not sent yet
+        """
+        try:
+            client.get_nowait()
+        except queue.Empty:
+            pass
+        client.put_nowait(body)
@@ -0,0 +1,90 @@
+"""
+    Detects switches between speaker and headset and reports them once per transition
+"""
+import logging
+from threading import Thread
+
+log = logging.getLogger("audiomanager")
+
+
+class DeviceWatcher:
+    def __init__(self, backend, get_config, http_sender, on_change=None, interval=2):
+        """
+        :param backend: AudioBackend reporting the default output device
+        :param get_config: callable returning the current config
+        :param http_sender: HttpSender for the Home Assistant toggles
+        :param on_change: callable run with the new device after a transition
+        :param interval: seconds between checks for backends without change notifications
+        """
+        self.backend = backend
+        self.get_config = get_config
+        self.http_sender = http_sender
+        self.on_change = on_change
+        self.interval = interval
+        self.keep_alive = True
+        # device of the default output and the device to use, which falls back to the headset
+        # if the speakers could not be switched on
+        self.detected_device = None
+        self.device = None
+        # name of the default output at the last check
+        self.output = None
+
+    def start(self):
+        """
+        detects the current device, then watches for changes in the background
+        :return:
+        """
+        try:
+            self.update()
+        except Exception as err:
+            # e.g. an unreachable sound server, the device is detected by the background checks later
+            log.info(f"Failed to detect the audio device: {err}")
+            self.__set_device('headset')
+        Thread(target=self.__watch, daemon=True).start()
+
+    def stop(self):
+        self.keep_alive = False
+
+    def __watch(self):
+        self.backend.initialize_thread()
+        failing = False
+        while self.keep_alive:
+            self.backend.wait_for_device_change(self.interval)
+            try:
+                self.update()
+            except Exception as err:
+                # only the first of consecutive failures is logged, e.g. while the sound server can't be reached
+                if failing:
+                    log.debug("Failed to detect the audio device: %s", err)
+                else:
+                    log.info(f"Failed to detect the audio device: {err}")
+                failing = True
+            else:
+                failing = False
+
+    def update(self):
+        """
+        :return: 'headset' or 'speaker'
+        """
+        config = self.get_config()
+        output = self.backend.get_default_output()
+        self.output = output
+        device = 'speaker' if output is not None and config['speakername'] in output else 'headset'
+        if device != self.detected_device:
+            self.detected_device = device
+            log.info(f"Audio device changed to {device} ({output})")
+            self.__set_device(device)
+            if device == 'speaker':
+                # without the speakers switched on, the headset is the only output left
+                self.http_sender.post(config['urls']['homeassistant']['toggle_off'],
+                                      on_failure=lambda err: self.__set_device('headset'))
+            else:
+                self.http_sender.post(config['urls']['homeassistant']['toggle_on'])
+        return self.device
+
+    def __set_device(self, device):
+        if device == self.device:
+            return
+        self.device = device
+        if self.on_change is not None:
+            self.on_change(device)
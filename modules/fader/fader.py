@@ -0,0 +1,247 @@
+"""
+    Runs all volume transitions from one thread, in batched ticks
+"""
+import logging
+import time
+from threading import Condition, Thread
+
+from modules.backends.audiobackend import VolumeWriteError
+from modules.metrics import metrics
+
+log = logging.getLogger("audiomanager")
+
+
+class Ramp:
+    __slots__ = ('session', 'current', 'target', 'step')
+
+    def __init__(self, session, current, target, transition_length):
+        self.session = session
+        self.current = current
+        self.retarget(target, transition_length)
+
+    def retarget(self, target, transition_length):
+        """
+        continues from the current volume towards the new target
+        :param target: volume to fade to
+        :param transition_length: number of steps for raising the volume, lowering takes two steps
+        :return:
+        """
+        self.target = target
+        self.step = (target - self.current) / transition_length
+        if self.step < 0:
+            self.step *= (transition_length / 2)
+
+    @classmethod
+    def resumed(cls, session, current, target, step):
+        """
+        :return: a Ramp continuing a transition of a previous run with its step
+        """
+        ramp = cls.__new__(cls)
+        ramp.session = session
+        ramp.current = current
+        ramp.target = target
+        ramp.step = step
+        return ramp
+
+    def advance(self):
+        """
+        :return: the next volume to set and True if the target was reached
+        """
+        if (self.current + self.step < self.target and self.current < self.target) or \
+                (self.current + self.step > self.target and self.current > self.target):
+            self.current += self.step
+            return self.current, False
+        self.current = self.target
+        return self.target, True
+
+
+class Fader:
+    def __init__(self, write_volumes, interval=.05, on_start=None, manual=False):
+        """
+        :param write_volumes: callable getting a list of (session, volume) to set in one go
+        :param interval: seconds between two steps
+        :param on_start: callable run first in the fader thread (e.g. COM initialisation)
+        :param manual: run the steps only through advance instead of a thread, e.g. on the virtual clock
+                       of a simulation
+        """
+        self.write_volumes = write_volumes
+        self.interval = interval
+        self.on_start = on_start
+        self.manual = manual
+        self.keep_alive = True
+        self.ramps = {}
+        # seconds passed through advance which were not stepped yet
+        self.__due = 0.0
+        # True while the writes keep failing, only the first failure is logged
+        self.__write_failing = False
+        self.__condition = Condition()
+        self.__thread = Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        if not self.manual:
+            self.__thread.start()
+
+    def advance(self, seconds):
+        """
+        runs the steps due after the time passed right away in the calling thread, for manual steps
+        :param seconds: time passed since the last call
+        :return:
+        """
+        self.__due += seconds
+        while self.__due >= self.interval and self.keep_alive and self.ramps:
+            self.__due -= self.interval
+            self.__tick()
+        if not self.ramps:
+            # a transition started later does not get the steps of the idle time
+            self.__due = 0.0
+
+    def stop(self):
+        """
+        ends the transitions, a tick in progress is finished first
+        :return:
+        """
+        with self.__condition:
+            self.keep_alive = False
+            self.__condition.notify()
+        if self.__thread.is_alive():
+            self.__thread.join()
+
+    def fade(self, key, session, current_volume, target_volume, transition_length):
+        """
+        starts a transition or retargets the running transition of the same key
+        :param key: name of the controlled application
+        :param session: session to set the volume of
+        :param current_volume: volume of the session, only used if no transition is running
+        :param target_volume: volume to fade to
+        :param transition_length: number of steps for raising the volume
+        :return: True if a transition was started or changed
+        """
+        with self.__condition:
+            ramp = self.ramps.get(key)
+            if ramp is None:
+                if current_volume == target_volume:
+                    metrics.fades.inc('dropped')
+                    return False
+                self.ramps[key] = Ramp(session, current_volume, target_volume, transition_length)
+                self.__condition.notify()
+                metrics.fades.inc('started')
+            elif ramp.target == target_volume and ramp.session is session:
+                metrics.fades.inc('dropped')
+                return False
+            else:
+                ramp.session = session
+                ramp.retarget(target_volume, transition_length)
+                metrics.fades.inc('retargeted')
+            metrics.active_fades.set(len(self.ramps))
+        return True
+
+    def resume(self, key, session, current_volume, target_volume, step):
+        """
+        continues a transition of a previous run, unless one of the key is running already
+        :param key: name of the controlled application
+        :param session: session to set the volume of
+        :param current_volume: volume of the session now
+        :param target_volume: volume to fade to
+        :param step: volume change per tick of the transition
+        :return: True if the transition was resumed
+        """
+        # a step leading away from the target would never reach it
+        if step == 0 or (target_volume - current_volume) * step <= 0:
+            return False
+        with self.__condition:
+            if key in self.ramps:
+                return False
+            self.ramps[key] = Ramp.resumed(session, current_volume, target_volume, step)
+            self.__condition.notify()
+            metrics.fades.inc('resumed')
+            metrics.active_fades.set(len(self.ramps))
+        return True
+
+    def snapshot(self):
+        """
+        :return: dict of key -> (session, current volume, target volume, step) of the running transitions
+        """
+        with self.__condition:
+            return {key: (ramp.session, ramp.current, ramp.target, ramp.step) for key, ramp in self.ramps.items()}
+
+    def cancel_sessions(self, keys, get_key):
+        """
+        ends the transitions of sessions which are gone
+        :param keys: keys of the removed sessions
+        :param get_key: callable returning the key of a session
+        :return:
+        """
+        keys = set(keys)
+        with self.__condition:
+            for key, ramp in list(self.ramps.items()):
+                if get_key(ramp.session) in keys:
+                    del self.ramps[key]
+                    metrics.fades.inc('cancelled')
+            metrics.active_fades.set(len(self.ramps))
+
+    def is_fading(self, key):
+        with self.__condition:
+            return key in self.ramps
+
+    def __run(self):
+        if self.on_start is not None:
+            self.on_start()
+        next_tick = time.monotonic()
+        while True:
+            with self.__condition:
+                while self.keep_alive and not self.ramps:
+                    self.__condition.wait()
+                    next_tick = time.monotonic()
+                if not self.keep_alive:
+                    return
+            self.__tick()
+            next_tick += self.interval
+            time.sleep(max(0, next_tick - time.monotonic()))
+
+    def __log_write_failure(self, err):
+        """
+        logs the first of consecutive failed writes, the steps go on every interval while e.g. the sound server
+        can't be reached
+        :param err: exception of the write
+        :return:
+        """
+        if self.__write_failing:
+            log.debug("Failed to set volumes: %s", err)
+        else:
+            log.info(f"Failed to set volumes: {err}")
+        self.__write_failing = True
+
+    def __tick(self):
+        """
+        advances all transitions by one step and writes the volumes as one batch
+        :return:
+        """
+        with self.__condition:
+            batch = []
+            finished = []
+            for key, ramp in self.ramps.items():
+                volume, done = ramp.advance()
+                batch.append((ramp.session, volume))
+                if done:
+                    finished.append((key, ramp, ramp.session))
+        # ramps at their target are only ended once the target was written, otherwise it is written again
+        failed = []
+        try:
+            with metrics.phase_latency.time('fade'):
+                self.write_volumes(batch)
+        except VolumeWriteError as err:
+            self.__log_write_failure(err)
+            failed = err.sessions
+        except Exception as err:
+            self.__log_write_failure(err)
+            failed = [audio_session for audio_session, volume in batch]
+        else:
+            self.__write_failing = False
+        with self.__condition:
+            for key, ramp, audio_session in finished:
+                # a ramp retargeted during the write goes on
+                if self.ramps.get(key) is ramp and ramp.session is audio_session and \
+                        ramp.current == ramp.target and \
+                        not any(audio_session is failed_session for failed_session in failed):
+                    del self.ramps[key]
+            metrics.active_fades.set(len(self.ramps))
@@ -0,0 +1,61 @@
+"""
+    Sends HTTP requests (e.g. Home Assistant webhooks) from a small pool, without blocking the caller
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+log = logging.getLogger("audiomanager")
+
+
+class HttpSender:
+    def __init__(self, workers=2, timeout=5):
+        """
+        :param workers: number of requests sent at the same time, also the size of the connection pool
+        :param timeout: seconds until connecting or reading a response is given up
+        """
+        self.workers = workers
+        self.timeout = timeout
+        # created by the first request, importing requests takes longer than the rest of the startup
+        self.session = None
+        self.__lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='httpsender')
+
+    def post(self, url, on_failure=None):
+        """
+        queues a POST request and returns immediately
+        :param url: url to post to, empty urls are skipped
+        :param on_failure: callable run with the exception if the request failed
+        :return: Future of the request or None
+        """
+        if not url:
+            return None
+        return self.executor.submit(self.__post, url, on_failure)
+
+    def __get_session(self):
+        with self.__lock:
+            if self.session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                self.session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+                self.session.mount('http://', adapter)
+                self.session.mount('https://', adapter)
+            return self.session
+
+    def __post(self, url, on_failure):
+        import requests
+        try:
+            self.__get_session().post(url, timeout=self.timeout)
+        except requests.RequestException as err:
+            log.info(f"Request to {url} failed: {err}")
+            if on_failure is not None:
+                on_failure(err)
+            return False
+        return True
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self.__lock:
+            if self.session is not None:
+                self.session.close()
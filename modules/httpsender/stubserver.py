@@ -0,0 +1,55 @@
+"""
+    Local HTTP server recording the requests it gets, for testing the HttpSender without Home Assistant
+
+    Usage:
+        with StubServer(delay=10) as server:
+            sender.post(server.url('/api/webhook/toggle_on'))
+"""
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+
+class StubServer:
+    def __init__(self, delay=0, status=200):
+        """
+        :param delay: seconds to wait before answering, to test timeouts
+        :param status: status code to answer with
+        """
+        self.delay = delay
+        self.status = status
+        self.requests = []
+        self.__server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub.requests.append((self.command, self.path))
+                time.sleep(stub.delay)
+                self.send_response(stub.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.__server.daemon_threads = True
+        Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def url(self, path='/'):
+        host, port = self.__server.server_address
+        return f'http://{host}:{port}{path}'
@@ -0,0 +1,144 @@
+"""
+    Fixed-size ring journal of the decisions of the control loop in a memory-mapped file
+
+    The file is a header followed by a ring of fixed-size records, the oldest records are overwritten.
+    Writing a record packs it straight into the mapping, without building strings or buffers, so the
+    journal can stay on all the time. Readers (see query.py) may read the file while it is written,
+    records are numbered, so a record overwritten while reading is recognized and skipped.
+
+    Kinds of records, with the fields they use:
+        added      a session appeared: name, key, active
+        removed    a session is gone: name, key
+        activity   a watched application started or stopped playing: name (profile entry), key, active
+        target     the target volume of a controlled application changed: name, value (new target),
+                   previous (old target, nan if there was none), cause (watched application which
+                   determined the target, empty for the standard volume)
+        fade       a transition was commanded: name (controlled application), key, value (target), previous (volume)
+        device     the output device changed: name ('headset' or 'speaker'), cause (device name)
+        toggle     a setting or profile was toggled: name, active (new value)
+"""
+import math
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+from threading import Lock
+
+MAGIC = b'AMJRNL01'
+# magic, record size, capacity, number of records written
+HEADER = struct.Struct('<8sIIQ')
+HEADER_SIZE = 64
+COUNT = struct.Struct('<Q')
+COUNT_OFFSET = 16
+# sequence number, time, kind, active, key, value, previous, name, cause
+RECORD = struct.Struct('<QdBBxxIff28s28s')
+
+KINDS = ('added', 'removed', 'activity', 'target', 'fade', 'device', 'toggle')
+ADDED, REMOVED, ACTIVITY, TARGET, FADE, DEVICE, TOGGLE = range(len(KINDS))
+
+Entry = namedtuple('Entry', 'sequence time kind active key value previous name cause')
+
+
+class Journal:
+    def __init__(self, path, size=4 * 1024 * 1024):
+        """
+        opens the journal, continuing an existing one with the same layout
+        :param path: journal file
+        :param size: bytes of the file, the number of records it keeps follows from it
+        """
+        self.path = path
+        self.capacity = (size - HEADER_SIZE) // RECORD.size
+        if self.capacity < 1:
+            raise ValueError(f"A journal of {size} bytes can't hold a record")
+        size = HEADER_SIZE + self.capacity * RECORD.size
+        self.sequence = 0
+        self.__lock = Lock()
+        # name -> encoded and truncated name, names repeat all the time
+        self.__encoded = {'': b''}
+        self.__file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        header = self.__file.read(HEADER.size)
+        if len(header) == HEADER.size:
+            magic, record_size, capacity, sequence = HEADER.unpack(header)
+            if (magic, record_size, capacity) == (MAGIC, RECORD.size, self.capacity):
+                self.sequence = sequence
+        if self.sequence == 0:
+            # records of a journal with another layout must not be taken for new ones
+            self.__file.truncate(0)
+        self.__file.truncate(size)
+        self.__map = mmap.mmap(self.__file.fileno(), size)
+        HEADER.pack_into(self.__map, 0, MAGIC, RECORD.size, self.capacity, self.sequence)
+
+    def close(self):
+        with self.__lock:
+            self.__map.flush()
+            self.__map.close()
+            self.__file.close()
+
+    def write(self, kind, name, key=0, value=math.nan, previous=math.nan, cause='', active=False):
+        """
+        :param kind: one of ADDED, REMOVED, ACTIVITY, TARGET, FADE, DEVICE and TOGGLE
+        :param name: application, session or setting name, longer names are truncated
+        :param key: session key, the sink-input index on Linux
+        :param value: new volume
+        :param previous: volume before
+        :param cause: name of what caused the record
+        :param active: state of the session or setting
+        :return:
+        """
+        encoded_name = self.__encoded.get(name)
+        if encoded_name is None:
+            encoded_name = self.__encode(name)
+        encoded_cause = self.__encoded.get(cause)
+        if encoded_cause is None:
+            encoded_cause = self.__encode(cause)
+        with self.__lock:
+            if self.__map.closed:
+                return
+            sequence = self.sequence
+            RECORD.pack_into(self.__map, HEADER_SIZE + (sequence % self.capacity) * RECORD.size,
+                             sequence, time.time(), kind, active, session_key(key), value, previous,
+                             encoded_name, encoded_cause)
+            self.sequence = sequence + 1
+            # the count is written last, so readers never see a record before it is complete
+            COUNT.pack_into(self.__map, COUNT_OFFSET, sequence + 1)
+
+    def __encode(self, name):
+        if len(self.__encoded) >= 4096:
+            self.__encoded = {'': b''}
+        encoded = self.__encoded[name] = str(name).encode('utf-8')[:28]
+        return encoded
+
+
+def session_key(key):
+    """
+    :param key: session key of a backend
+    :return: the key as an unsigned 32 bit number, 0 if it is not a number
+    """
+    if type(key) is int:
+        return key & 0xFFFFFFFF
+    if type(key) is str and key.isdigit():
+        return int(key) & 0xFFFFFFFF
+    return 0
+
+
+def read_journal(path):
+    """
+    :param path: journal file
+    :return: list of Entries, oldest first
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    magic, record_size, capacity, sequence = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a journal")
+    entries = []
+    for expected in range(max(0, sequence - capacity), sequence):
+        offset = HEADER_SIZE + (expected % capacity) * RECORD.size
+        record_sequence, timestamp, kind, active, key, value, previous, name, cause = RECORD.unpack_from(data, offset)
+        if record_sequence != expected:
+            continue
+        entries.append(Entry(record_sequence, timestamp, KINDS[kind], bool(active), key, value, previous,
+                             name.rstrip(b'\0').decode('utf-8', 'replace'),
+                             cause.rstrip(b'\0').decode('utf-8', 'replace')))
+    return entries
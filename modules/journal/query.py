@@ -0,0 +1,146 @@
+"""
+    Answers questions from the journal of a running or stopped audiomanager
+
+    Usage (from the repository root):
+        python -m modules.journal.query why spotify --at 21:03
+        python -m modules.journal.query list --name spotify --since 21:00 --until 21:05
+        python -m modules.journal.query list --kind target fade --last 20
+
+    Times are HH:MM[:SS] (the last such time before now) or YYYY-MM-DD HH:MM[:SS], names match as part
+    of the name, ignoring case.
+"""
+import argparse
+import datetime
+import math
+import sys
+import time
+
+from modules.journal.journal import KINDS, read_journal
+
+
+def parse_time(value):
+    """
+    :param value: HH:MM[:SS] or YYYY-MM-DD HH:MM[:SS]
+    :return: seconds since the epoch
+    """
+    now = datetime.datetime.now()
+    for layout in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+        try:
+            return datetime.datetime.strptime(value, layout).timestamp()
+        except ValueError:
+            pass
+    for layout in ('%H:%M:%S', '%H:%M'):
+        try:
+            clock = datetime.datetime.strptime(value, layout).time()
+        except ValueError:
+            continue
+        moment = datetime.datetime.combine(now.date(), clock)
+        if moment > now:
+            moment -= datetime.timedelta(days=1)
+        return moment.timestamp()
+    raise argparse.ArgumentTypeError(f"{value} is not a time like 21:03 or 2024-05-01 21:03")
+
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def format_volume(volume):
+    return '-' if math.isnan(volume) else f"{volume*100:.0f}%"
+
+
+def describe(entry):
+    """
+    :return: one line of text for the entry
+    """
+    text = f"{format_time(entry.time)} {entry.kind:<8} {entry.name}"
+    if entry.kind in ('added', 'activity'):
+        text += f" #{entry.key} {'active' if entry.active else 'inactive'}"
+    elif entry.kind == 'removed':
+        text += f" #{entry.key}"
+    elif entry.kind == 'target':
+        text += f" {format_volume(entry.previous)} -> {format_volume(entry.value)} ({entry.cause or 'standard'})"
+    elif entry.kind == 'fade':
+        text += f" #{entry.key} {format_volume(entry.previous)} -> {format_volume(entry.value)}"
+    elif entry.kind == 'device':
+        text += f" ({entry.cause})"
+    elif entry.kind == 'toggle':
+        text += f" {'on' if entry.active else 'off'}"
+    return text
+
+
+def why(entries, name, at):
+    """
+    :param entries: Entries of the journal
+    :param name: part of the name of a controlled application
+    :param at: seconds since the epoch
+    :return: lines explaining the volume of the application at that time
+    """
+    name = name.lower()
+    before = [entry for entry in entries if entry.time <= at]
+    targets = [entry for entry in before if entry.kind == 'target' and name in entry.name.lower()]
+    if not targets:
+        oldest = f", the journal starts at {format_time(entries[0].time)}" if entries else ", the journal is empty"
+        return [f"No target volume of {name} was resolved before {format_time(at)}{oldest}"]
+    target = targets[-1]
+    lines = [f"At {format_time(at)}, {target.name} had the target volume {format_volume(target.value)}, "
+             f"resolved at {format_time(target.time)} (before: {format_volume(target.previous)})"]
+    if target.cause == '':
+        lines.append("No watched application was playing, so it got its standard volume")
+    elif target.cause == 'hear_through':
+        lines.append("Hear through was enabled")
+    elif target.cause == 'reset_volume_sessions':
+        lines.append("reset_volume_sessions was enabled, so all volumes were reset to 100%")
+    else:
+        activities = [entry for entry in before if entry.kind == 'activity' and entry.name == target.cause
+                      and entry.time <= target.time]
+        since = f" since {format_time(activities[-1].time)}" if activities and activities[-1].active else ''
+        lines.append(f"Because {target.cause} was playing{since}, it had the lowest volume of the active watched applications")
+    devices = [entry for entry in before if entry.kind == 'device']
+    if devices:
+        lines.append(f"Output device: {devices[-1].name} ({devices[-1].cause})")
+    fades = [entry for entry in before if entry.kind == 'fade' and entry.name == target.name and entry.time >= target.time]
+    for fade in fades[:1]:
+        lines.append(f"Faded from {format_volume(fade.previous)} to {format_volume(fade.value)} at {format_time(fade.time)}")
+    toggles = [entry for entry in before if entry.kind == 'toggle' and entry.time <= target.time]
+    if toggles and toggles[-1].time >= target.time - 5:
+        lines.append(f"Right after toggling {toggles[-1].name} {'on' if toggles[-1].active else 'off'}")
+    return lines
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Queries the journal of the volume decisions")
+    parser.add_argument('--journal', default='./logs/journal.bin', help="journal file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    why_parser = commands.add_parser('why', help="explains the volume of an application at a time")
+    why_parser.add_argument('name', help="controlled application")
+    why_parser.add_argument('--at', type=parse_time, default=None, help="time, now by default")
+    list_parser = commands.add_parser('list', help="lists entries")
+    list_parser.add_argument('--name', help="part of the name")
+    list_parser.add_argument('--kind', nargs='+', choices=KINDS)
+    list_parser.add_argument('--since', type=parse_time)
+    list_parser.add_argument('--until', type=parse_time)
+    list_parser.add_argument('--last', type=int, default=50, help="number of entries, 0 for all")
+    arguments = parser.parse_args(arguments)
+
+    try:
+        entries = read_journal(arguments.journal)
+    except (OSError, ValueError) as err:
+        print(f"Can't read the journal: {err}")
+        return 1
+    if arguments.command == 'why':
+        for line in why(entries, arguments.name, arguments.at if arguments.at is not None else time.time()):
+            print(line)
+        return 0
+    selected = [entry for entry in entries
+                if (arguments.name is None or arguments.name.lower() in entry.name.lower())
+                and (arguments.kind is None or entry.kind in arguments.kind)
+                and (arguments.since is None or entry.time >= arguments.since)
+                and (arguments.until is None or entry.time <= arguments.until)]
+    for entry in selected[-arguments.last:] if arguments.last else selected:
+        print(describe(entry))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
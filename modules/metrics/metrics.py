@@ -0,0 +1,188 @@
+"""
+    Counters, gauges and latency histograms of the control loop, served in the Prometheus text format
+"""
+import bisect
+import logging
+import time
+from threading import Lock, Thread
+
+log = logging.getLogger("audiomanager")
+
+LATENCY_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return [f'{self.name}{format_labels(self.labelnames, labels)} {value}' for labels, value in values]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, *labelvalues):
+        with self.lock:
+            self.values[labelvalues] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket (last one is +Inf), sum]
+        self.values = {}
+        self.lock = Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labelvalues)
+            if counts is None:
+                counts = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def time(self, *labelvalues):
+        """
+        :return: context manager observing the time spent in it
+        """
+        return Timer(self, labelvalues)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bucket, count in zip(list(self.buckets) + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(self.labelnames, labels, [("le", bucket)])} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Timer:
+    __slots__ = ('histogram', 'labelvalues', 'start')
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        :return: all metrics in the Prometheus text format
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+phase_latency = registry.register(Histogram(
+    'audiomanager_phase_seconds', 'Time spent per phase of the control loop', ('phase',)))
+ticks = registry.register(Counter(
+    'audiomanager_ticks_total', 'Control loop iterations by result', ('result',)))
+subprocess_spawns = registry.register(Counter(
+    'audiomanager_subprocess_spawns_total', 'Processes started', ('command',)))
+volume_writes = registry.register(Counter(
+    'audiomanager_volume_writes_total', 'Volume writes by result', ('result',)))
+fades = registry.register(Counter(
+    'audiomanager_fades_total', 'Fade requests by result', ('result',)))
+sessions = registry.register(Gauge(
+    'audiomanager_sessions', 'Audio sessions in the current snapshot', ('host',)))
+active_fades = registry.register(Gauge(
+    'audiomanager_active_fades', 'Fades in flight'))
+startup = registry.register(Gauge(
+    'audiomanager_startup_seconds', 'Seconds from the start of the process to each startup milestone', ('milestone',)))
+
+
+class MetricsServer:
+    def __init__(self, registry, host='0.0.0.0', port=9105):
+        """
+        :param registry: MetricsRegistry to serve
+        :param host: address to listen on
+        :param port: port to listen on
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.__server = None
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics_registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics_registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.__server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as err:
+            log.info(f"Failed to start the metrics server on port {self.port}: {err}")
+            return
+        self.__server.daemon_threads = True
+        Thread(target=self.__server.serve_forever, daemon=True).start()
+        log.info(f"Serving metrics on port {self.port}")
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
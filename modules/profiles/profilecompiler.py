@@ -0,0 +1,295 @@
+"""
+    Compiles config.yaml and the profile files into a resolved, read-only rule table
+"""
+import logging
+import os
+import time
+from collections.abc import Mapping
+from threading import Condition, Event, Lock, Thread
+from types import MappingProxyType
+
+import yaml
+
+log = logging.getLogger("audiomanager")
+
+# libyaml is a lot faster, but not available on every install
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def freeze(value):
+    """
+    :param value: config as loaded from YAML
+    :return: read-only copy, dicts become mappingproxies and lists tuples
+    """
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """
+    :param value: config frozen by freeze
+    :return: changeable copy, e.g. to dump it as YAML or to change it for update_config
+    """
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class ProfileTable:
+    """
+    result of one compilation or config change, never changed after it was published
+    """
+    __slots__ = ('config', 'volume_profiles', 'profile_applications', 'mic_profiles', 'dev_log', 'version')
+
+    def __init__(self, config, volume_profiles, profile_applications, mic_profiles):
+        """
+        :param config: dict of config.yaml, a read-only copy is kept
+        """
+        self.config = freeze(config)
+        self.volume_profiles = volume_profiles
+        self.profile_applications = profile_applications
+        self.mic_profiles = mic_profiles
+        self.dev_log = config['dev_log']
+        # number of the table, counted up by the ProfileWatcher with every published table
+        self.version = 0
+
+    def replace_config(self, config):
+        """
+        :param config: changed copy of the config (see thaw), the profile files are the same
+        :return: a new ProfileTable with the config
+        """
+        return ProfileTable(config, self.volume_profiles, self.profile_applications, self.mic_profiles)
+
+    def same_rules(self, other):
+        return other is not None and \
+            (self.config, self.volume_profiles, self.profile_applications, self.mic_profiles) == \
+            (other.config, other.volume_profiles, other.profile_applications, other.mic_profiles)
+
+
+class ProfileCompiler:
+    def __init__(self, config_path, profiles_path):
+        self.config_path = config_path
+        self.profiles_path = profiles_path
+
+    def files(self):
+        """
+        :return: paths of config.yaml and all profile files
+        """
+        return [self.config_path] + [os.path.join(self.profiles_path, file)
+                                     for file in sorted(os.listdir(self.profiles_path))
+                                     if file.startswith('profiles') and file.endswith('.yaml')]
+
+    def fingerprint(self):
+        """
+        cheap identity of all source files, changes whenever a file is edited, added or removed
+        :return:
+        """
+        fingerprint = []
+        for file in self.files():
+            try:
+                stat = os.stat(file)
+            except FileNotFoundError:
+                fingerprint.append((file, None))
+            else:
+                fingerprint.append((file, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(fingerprint)
+
+    def compile(self):
+        """
+        reads all files and resolves the groups (profiles_<group>.yaml) into single applications
+        :return: ProfileTable
+        """
+        config = self.__read(self.config_path)
+        volume_profiles = self.__read(os.path.join(self.profiles_path, "profiles.yaml"))
+        mic_profiles = self.__read(os.path.join(self.profiles_path, "profiles_microphone.yaml"))
+
+        groups = {}
+        for file in sorted(os.listdir(self.profiles_path)):
+            if not file.startswith('profiles_') or not file.endswith('.yaml') or "microphone" in file:
+                continue
+            profile_id = file.replace("profiles_", '').replace(".yaml", '')
+            groups[profile_id] = self.__read(os.path.join(self.profiles_path, file)) or {}
+            config['profiles'].setdefault(profile_id, True)
+        config['profiles'].setdefault('microphone', True)
+
+        # replace watched groups by their applications, the group settings win over single entries
+        watched_profiles = {}
+        for application, watched in volume_profiles.items():
+            rules = {name: setting for name, setting in watched.items() if name not in groups}
+            for name, setting in watched.items():
+                if name in groups:
+                    rules.update(dict.fromkeys(groups[name], setting))
+            watched_profiles[application] = rules
+
+        # replace controlled groups by their applications with the group file value as standard volume
+        resolved = {application: rules for application, rules in watched_profiles.items() if application not in groups}
+        for application, rules in watched_profiles.items():
+            if application not in groups:
+                continue
+            for member, volume in groups[application].items():
+                resolved[member] = {**rules, "standard": {"headset": volume, "speaker": volume}}
+
+        log.debug('Profiles: %s', resolved)
+        return ProfileTable(
+            config=config,
+            volume_profiles=MappingProxyType({application: MappingProxyType(rules)
+                                              for application, rules in resolved.items()}),
+            profile_applications=MappingProxyType({profile_id: frozenset(members)
+                                                   for profile_id, members in groups.items()}),
+            mic_profiles=MappingProxyType(dict(mic_profiles or {})))
+
+    def save_config(self, config):
+        """
+        replaces config.yaml atomically, readers see either the old or the new file
+        :param config: dict of the config
+        :return:
+        """
+        temporary_path = f"{self.config_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            yaml.dump(config, file)
+        os.replace(temporary_path, self.config_path)
+
+    @staticmethod
+    def __read(path):
+        with open(path, "r", encoding="utf-8") as file:
+            return yaml.load(file, YamlLoader)
+
+
+class ProfileWatcher:
+    def __init__(self, compiler, interval=1, debounce=.5):
+        """
+        :param compiler: ProfileCompiler
+        :param interval: seconds between checks of the source files
+        :param debounce: seconds a changed config has to stay unchanged before config.yaml is written
+        """
+        self.compiler = compiler
+        self.interval = interval
+        self.debounce = debounce
+        self.table = None
+        self.fingerprint = None
+        self.keep_alive = True
+        self.changed = Event()
+        # callables run after a table was published
+        self.listeners = []
+        self.__lock = Lock()
+        # config changed by update_config which is not in config.yaml yet
+        self.__pending = None
+        self.__write_at = 0
+        self.__writing = Condition()
+        self.__writer = Thread(target=self.__write_config, daemon=True)
+
+    def start(self):
+        """
+        blocks until a first valid table was compiled, then watches the files in the background
+        :return:
+        """
+        while not self.reload():
+            log.info("Failed to load config.yaml.")
+            time.sleep(5)
+        Thread(target=self.__watch, daemon=True).start()
+        self.__writer.start()
+
+    def stop(self):
+        """
+        stops watching, a changed config which is not written yet is written first
+        :return:
+        """
+        self.keep_alive = False
+        with self.__writing:
+            self.__writing.notify()
+        if self.__writer.is_alive():
+            self.__writer.join()
+
+    def subscribe(self, listener):
+        """
+        :param listener: callable run after a new table was published, e.g. waking a control loop
+        :return:
+        """
+        self.listeners.append(listener)
+
+    def update_config(self, change):
+        """
+        publishes a table with a changed copy of the config right away, config.yaml is written in the
+        background once the config stayed unchanged for the debounce time, so a burst of changes is written once
+        :param change: callable changing the copy of the config in place, its result is returned
+        :return: the result of change
+        """
+        with self.__lock:
+            config = thaw(self.table.config)
+            result = change(config)
+            self.__publish(self.table.replace_config(config))
+            with self.__writing:
+                self.__pending = config
+                self.__write_at = time.monotonic() + self.debounce
+                self.__writing.notify()
+        return result
+
+    def reload(self, force=False):
+        """
+        recompiles if any source file changed, keeps the last good table if compiling fails,
+        files changed while a changed config is not written yet are only read after it was written
+        :param force: recompile even if the files look unchanged
+        :return: True if a valid table is live
+        """
+        with self.__lock:
+            if self.__pending is not None:
+                # config.yaml is older than the published config
+                return True
+            fingerprint = self.compiler.fingerprint()
+            if not force and self.table is not None and fingerprint == self.fingerprint:
+                return True
+            try:
+                table = self.compiler.compile()
+            except (OSError, yaml.YAMLError, AttributeError, KeyError, TypeError) as err:
+                if self.table is not None:
+                    log.info(f"Failed to load profiles, keeping the previous ones: {err}")
+                    # remember the broken state, so it is only reported once
+                    self.fingerprint = fingerprint
+                return self.table is not None
+            self.fingerprint = fingerprint
+            if not table.same_rules(self.table):
+                self.__publish(table)
+            return True
+
+    def __publish(self, table):
+        table.version = self.table.version + 1 if self.table is not None else 1
+        # a single assignment, readers see either the old or the new table
+        self.table = table
+        self.changed.set()
+        for listener in self.listeners:
+            listener()
+
+    def __watch(self):
+        while self.keep_alive:
+            time.sleep(self.interval)
+            if not self.keep_alive:
+                # stopped while sleeping, the files may be gone already
+                break
+            try:
+                self.reload()
+            except OSError as err:
+                log.info(f"Failed to check profiles: {err}")
+
+    def __write_config(self):
+        while True:
+            with self.__writing:
+                while self.__pending is None and self.keep_alive:
+                    self.__writing.wait()
+                while self.__pending is not None and self.keep_alive and self.__write_at > time.monotonic():
+                    self.__writing.wait(self.__write_at - time.monotonic())
+                config = self.__pending
+            if config is None:
+                return
+            try:
+                self.compiler.save_config(config)
+            except (OSError, yaml.YAMLError) as err:
+                log.info(f"Failed to save config.yaml: {err}")
+            with self.__writing:
+                # a newer config is written in the next round
+                if self.__pending is config:
+                    self.__pending = None
@@ -0,0 +1,100 @@
+"""
+    Single pass parsers for the output of `pactl list sink-inputs` and `pactl list sinks`
+"""
+import json
+import re
+
+from modules.audiosessions.audiosession import AudioSession
+
+# raw volume of 100%
+VOLUME_NORM = 0x10000
+
+RAW_VOLUME = re.compile(r'(\d+) /\s*\d+%')
+
+
+def parse_sink_inputs_json(output):
+    """
+    parses the output of `pactl --format=json list sink-inputs`
+    :param output: str or bytes
+    :return: list of AudioSessions
+    """
+    audio_sessions = []
+    for sink_input in json.loads(output):
+        properties = sink_input.get('properties', {})
+        channel_volumes = tuple(channel['value'] / VOLUME_NORM for channel in sink_input['volume'].values())
+        audio_sessions.append(AudioSession(name=properties.get('node.name'),
+                                           process=properties.get('application.process.binary'),
+                                           process_id=str(sink_input['index']),
+                                           state=not sink_input['mute'] and not sink_input.get('corked', False),
+                                           current_volume=round(channel_volumes[0], 3) if channel_volumes else 0,
+                                           channel_volumes=channel_volumes))
+    return audio_sessions
+
+
+def parse_sink_inputs_text(output):
+    """
+    parses the output of `LC_ALL=C pactl list sink-inputs` line by line
+    :param output: str
+    :return: list of AudioSessions
+    """
+    audio_sessions = []
+    record = None
+
+    def finish(record):
+        if record is not None:
+            channel_volumes = record['volumes']
+            audio_sessions.append(AudioSession(name=record['properties'].get('node.name'),
+                                               process=record['properties'].get('application.process.binary'),
+                                               process_id=record['index'],
+                                               state=not record['mute'] and not record['corked'],
+                                               current_volume=round(channel_volumes[0], 3) if channel_volumes else 0,
+                                               channel_volumes=channel_volumes))
+
+    for line in output.splitlines():
+        if line.startswith('Sink Input #'):
+            finish(record)
+            record = {'index': line[len('Sink Input #'):].strip(), 'mute': False, 'corked': False, 'volumes': (),
+                      'properties': {}}
+        elif record is None:
+            continue
+        elif line.startswith('\t\t'):
+            # property lines look like: <tab><tab>key = "value"
+            key, separator, value = line.strip().partition(' = ')
+            if separator:
+                record['properties'][key] = value.strip('"')
+        elif line.startswith('\tMute: '):
+            record['mute'] = line[len('\tMute: '):].strip() == 'yes'
+        elif line.startswith('\tCorked: '):
+            record['corked'] = line[len('\tCorked: '):].strip() == 'yes'
+        elif line.startswith('\tVolume: '):
+            record['volumes'] = tuple(int(raw) / VOLUME_NORM for raw in RAW_VOLUME.findall(line))
+    finish(record)
+    return audio_sessions
+
+
+def parse_sink_descriptions_json(output):
+    """
+    parses the output of `pactl --format=json list sinks`
+    :param output: str or bytes
+    :return: dict of sink name -> description
+    """
+    return {sink['name']: sink.get('description', '') for sink in json.loads(output)}
+
+
+def parse_sink_descriptions_text(output):
+    """
+    parses the output of `LC_ALL=C pactl list sinks` line by line
+    :param output: str
+    :return: dict of sink name -> description
+    """
+    descriptions = {}
+    name = None
+    for line in output.splitlines():
+        if line.startswith('Sink #'):
+            name = None
+        elif line.startswith('\tName: '):
+            name = line[len('\tName: '):].strip()
+            descriptions[name] = ''
+        elif line.startswith('\tDescription: ') and name is not None:
+            descriptions[name] = line[len('\tDescription: '):].strip()
+    return descriptions
@@ -0,0 +1,217 @@
+"""
+    Connections to the PulseAudio/PipeWire sound server
+"""
+import json
+import logging
+import os
+import subprocess
+import time
+from threading import RLock
+
+from modules.audiosessions.audiosession import AudioSession
+from modules.metrics import metrics
+from modules.pulseaudio.pactlparser import parse_sink_descriptions_json, parse_sink_descriptions_text, \
+    parse_sink_inputs_json, parse_sink_inputs_text
+
+try:
+    import pulsectl
+except (ImportError, OSError):
+    # OSError if libpulse itself is missing
+    pulsectl = None
+
+log = logging.getLogger("audiomanager")
+
+
+def connect(server=None):
+    """
+    :param server: address of the sound server (like PULSE_SERVER), None for the default server
+    :return: PulseConnection if pulsectl is installed, also if the server can't be reached yet, otherwise PactlConnection
+    """
+    if pulsectl is not None:
+        return PulseConnection(server)
+    log.info("pulsectl is not installed, falling back to pactl.")
+    return PactlConnection(server)
+
+
+class PulseConnection:
+    """
+    keeps a single native protocol connection (through libpulse) for all queries and volume writes
+    """
+    def __init__(self, server=None, retry_interval=5):
+        """
+        :param server: address of the sound server, None for the default server
+        :param retry_interval: seconds between two connection attempts while the server can't be reached
+        """
+        self.server = server
+        self.retry_interval = retry_interval
+        self.__lock = RLock()
+        self.__channels = {}
+        self.__pulse = None
+        # no connection is attempted before this time after a failed one
+        self.__retry_at = 0
+        try:
+            self.__connect()
+        except pulsectl.PulseError as err:
+            # requests fail until the server can be reached
+            log.info(f"Failed to connect to the sound server, retrying: {err}")
+
+    def __connect(self):
+        if self.__pulse is not None:
+            self.__pulse.close()
+            self.__pulse = None
+        now = time.monotonic()
+        if now < self.__retry_at:
+            raise pulsectl.PulseDisconnected("The sound server can't be reached")
+        try:
+            self.__pulse = pulsectl.Pulse('audiomanager', server=self.server)
+        except pulsectl.PulseError:
+            self.__retry_at = now + self.retry_interval
+            raise
+
+    def __call(self, method, *args):
+        """
+        runs a request on the connection, connects first if there is none and reconnects once if
+        the server went away
+        :return:
+        """
+        with self.__lock:
+            if self.__pulse is None:
+                self.__connect()
+            try:
+                return getattr(self.__pulse, method)(*args)
+            except pulsectl.PulseDisconnected:
+                log.info("Lost connection to the sound server, reconnecting.")
+                self.__connect()
+                return getattr(self.__pulse, method)(*args)
+
+    def close(self):
+        with self.__lock:
+            if self.__pulse is not None:
+                self.__pulse.close()
+
+    def sink_inputs(self):
+        """
+        :return: list of AudioSessions, one per sink-input
+        """
+        audio_sessions = []
+        channels = {}
+        for sink_input in self.__call('sink_input_list'):
+            channels[sink_input.index] = sink_input.channel_count
+            audio_sessions.append(AudioSession(name=sink_input.proplist.get('node.name'),
+                                               process=sink_input.proplist.get('application.process.binary'),
+                                               process_id=str(sink_input.index),
+                                               state=not sink_input.mute and not sink_input.corked,
+                                               current_volume=round(sink_input.volume.values[0], 3),
+                                               channel_volumes=tuple(sink_input.volume.values)))
+        self.__channels = channels
+        return audio_sessions
+
+    def set_sink_input_volume(self, index, volume):
+        """
+        :param index: index of the sink-input
+        :param volume: volume for all channels, 1 is 100%
+        :return:
+        """
+        index = int(index)
+        if index not in self.__channels:
+            self.__channels[index] = self.__call('sink_input_info', index).channel_count
+        self.__call('sink_input_volume_set', index, pulsectl.PulseVolumeInfo(volume, self.__channels[index]))
+
+    def is_muted(self, index):
+        """
+        :param index: index of the sink-input
+        :return: True if the sink-input is muted
+        """
+        return bool(self.__call('sink_input_info', int(index)).mute)
+
+    def default_sink(self):
+        """
+        :return: name and description of the default sink
+        """
+        sink = self.__call('get_sink_by_name', self.__call('server_info').default_sink_name)
+        return f'{sink.name} {sink.description}'
+
+    def toggle_default_sink_mute(self):
+        sink = self.__call('get_sink_by_name', self.__call('server_info').default_sink_name)
+        self.__call('mute', sink, not sink.mute)
+
+    def set_default_source_volume(self, volume):
+        """
+        :param volume: volume for all channels of the default source (microphone), 1 is 100%
+        :return:
+        """
+        source = self.__call('get_source_by_name', self.__call('server_info').default_source_name)
+        self.__call('volume_set_all_chans', source, volume)
+
+
+class PactlConnection:
+    """
+    fallback without pulsectl, spawns one pactl per request
+    """
+    def __init__(self, server=None):
+        self.server = server
+        # None until it is known whether pactl supports --format=json (PulseAudio 16 and newer)
+        self.json_supported = None
+        # untranslated output, the text parser relies on the english field names
+        self.environment = dict(os.environ, LC_ALL='C')
+
+    def __pactl(self, *args):
+        command = ['pactl'] if self.server is None else ['pactl', '--server', self.server]
+        metrics.subprocess_spawns.inc('pactl')
+        result = subprocess.run(command + list(args), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                env=self.environment)
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, command + list(args))
+        return result.stdout.decode('utf-8')
+
+    def close(self):
+        pass
+
+    def sink_inputs(self):
+        """
+        :return: list of AudioSessions, one per sink-input
+        """
+        if self.json_supported is not False:
+            try:
+                audio_sessions = parse_sink_inputs_json(self.__pactl('--format=json', 'list', 'sink-inputs'))
+            except (subprocess.CalledProcessError, json.JSONDecodeError):
+                if self.json_supported:
+                    raise
+                log.info("pactl does not support --format=json, parsing its text output.")
+                self.json_supported = False
+            else:
+                self.json_supported = True
+                return audio_sessions
+        return parse_sink_inputs_text(self.__pactl('list', 'sink-inputs'))
+
+    def set_sink_input_volume(self, index, volume):
+        self.__pactl('set-sink-input-volume', str(index), f'{volume*100}%')
+
+    def is_muted(self, index):
+        for audio_session in self.sink_inputs():
+            if audio_session.Process.id == str(index):
+                return not audio_session.State
+        return False
+
+    def default_sink(self):
+        """
+        :return: name and description of the default sink, like PulseConnection.default_sink
+        """
+        name = self.__pactl('get-default-sink').strip()
+        descriptions = None
+        if self.json_supported is not False:
+            try:
+                descriptions = parse_sink_descriptions_json(self.__pactl('--format=json', 'list', 'sinks'))
+            except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError, TypeError):
+                if self.json_supported:
+                    raise
+        if descriptions is None:
+            descriptions = parse_sink_descriptions_text(self.__pactl('list', 'sinks'))
+        description = descriptions.get(name)
+        return f'{name} {description}' if description else name
+
+    def toggle_default_sink_mute(self):
+        self.__pactl('set-sink-mute', '@DEFAULT_SINK@', 'toggle')
+
+    def set_default_source_volume(self, volume):
+        self.__pactl('set-source-volume', '@DEFAULT_SOURCE@', f'{volume*100}%')
@@ -0,0 +1,100 @@
+"""
+    Private PulseAudio server without audio hardware, for testing the sound server connections
+
+    Usage:
+        with StandInServer() as server:
+            server.add_stream("spotify")
+            connection = connect(server.address)
+
+    Several of them stand in for the hosts of a MultiHostManager, with their addresses as the servers
+    in the hosts list of config.yaml.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from modules.pulseaudio.pulseconnection import connect
+
+
+class StandInServer:
+    def __init__(self, startup_timeout=5):
+        """
+        :param startup_timeout: seconds to wait for the server socket
+        """
+        self.startup_timeout = startup_timeout
+        self.directory = None
+        self.address = None
+        self.__server = None
+        self.__streams = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """
+        starts pulseaudio with a null sink and a private socket, no real devices are loaded
+        :return:
+        """
+        if shutil.which('pulseaudio') is None:
+            raise RuntimeError("pulseaudio is required for the stand-in server")
+        self.directory = tempfile.mkdtemp(prefix='audiomanager-pulse-')
+        socket = os.path.join(self.directory, 'native')
+        self.address = f'unix:{socket}'
+        environment = dict(os.environ, HOME=self.directory, PULSE_RUNTIME_PATH=self.directory,
+                           PULSE_STATE_PATH=self.directory, XDG_CONFIG_HOME=self.directory)
+        self.__server = subprocess.Popen(
+            ['pulseaudio', '--daemonize=no', '--system=no', '--use-pid-file=no', '--exit-idle-time=-1',
+             '--disable-shm=yes', '-n',
+             '--load=module-null-sink sink_name=standin',
+             f'--load=module-native-protocol-unix socket={socket} auth-anonymous=1'],
+            env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + self.startup_timeout
+        while not os.path.exists(socket):
+            if time.monotonic() > deadline or self.__server.poll() is not None:
+                self.stop()
+                raise RuntimeError("stand-in server did not start")
+            time.sleep(.05)
+
+    def stop(self):
+        for stream in self.__streams.values():
+            stream.terminate()
+            stream.wait()
+        self.__streams = {}
+        if self.__server is not None:
+            self.__server.terminate()
+            self.__server.wait()
+            self.__server = None
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def add_stream(self, process_binary):
+        """
+        plays silence into the null sink, which shows up as a sink-input
+        :param process_binary: value of application.process.binary, used for matching profiles
+        :return: id of the stream for remove_stream
+        """
+        stream = subprocess.Popen(
+            ['pacat', '--playback', f'--server={self.address}', '--device=standin',
+             f'--property=application.process.binary={process_binary}',
+             f'--property=node.name={process_binary}', '/dev/zero'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.__streams[stream.pid] = stream
+        return stream.pid
+
+    def remove_stream(self, stream_id):
+        stream = self.__streams.pop(stream_id)
+        stream.terminate()
+        stream.wait()
+
+    def connect(self):
+        """
+        :return: connection to the stand-in server
+        """
+        return connect(self.address)
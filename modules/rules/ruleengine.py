@@ -0,0 +1,151 @@
+"""
+    Resolves the target volumes of the controlled applications incrementally
+
+    A reverse index from every watched application (and group) to the controlled applications it
+    affects limits each update to the targets whose inputs changed since the previous update.
+"""
+import logging
+
+log = logging.getLogger("audiomanager")
+
+
+class RuleEngine:
+    def __init__(self, table):
+        """
+        :param table: ProfileTable to evaluate
+        """
+        self.table = table
+        self.profiles = dict(table.config['profiles'])
+        # controlled application -> (standard volumes, ((watched application, volumes), ...))
+        self.rules = {}
+        # watched application -> controlled applications
+        self.watchers = {}
+        for application, rules in table.volume_profiles.items():
+            watched = tuple((name, volumes) for name, volumes in rules.items() if name != 'standard')
+            self.rules[application] = (rules['standard'], watched)
+            for name, volumes in watched:
+                self.watchers.setdefault(name, set()).add(application)
+        # watched application -> groups it belongs to, group -> controlled applications
+        self.groups = {}
+        self.group_applications = {}
+        for group, members in table.profile_applications.items():
+            affected = set()
+            for member in members:
+                self.groups[member] = self.groups.get(member, ()) + (group,)
+                affected.update(self.watchers.get(member, ()))
+            self.group_applications[group] = affected
+        # profile entry -> (session key, active) for the last update
+        self.statuses = {}
+        # controlled application -> target volume, for all controlled applications with a session
+        self.targets = {}
+        # controlled application -> watched application which determined the target, '' for the standard volume
+        self.causes = {}
+        # watched applications whose session or activity changed in the last update
+        self.changed_statuses = []
+        self.device = None
+        self.hear_through = None
+        self.dirty = set(self.rules)
+
+    def adopt(self, table):
+        """
+        takes over a table which differs at most in the group toggles, only the applications watching
+        a toggled group are recomputed
+        :param table: ProfileTable
+        :return: False if the rules differ and a new RuleEngine is needed
+        """
+        if table.volume_profiles != self.table.volume_profiles or \
+                table.profile_applications != self.table.profile_applications or \
+                {key: value for key, value in table.config.items() if key != 'profiles'} != \
+                {key: value for key, value in self.table.config.items() if key != 'profiles'}:
+            return False
+        for group, enabled in table.config['profiles'].items():
+            if self.profiles.get(group) != enabled:
+                self.dirty.update(self.group_applications.get(group, ()))
+        self.table = table
+        self.profiles = dict(table.config['profiles'])
+        return True
+
+    def update(self, session_index, get_key, is_session_active, device, hear_through):
+        """
+        recomputes the targets affected by changes of the sessions, the device or hear through
+        :param session_index: SessionIndex of the current sessions
+        :param get_key: callable returning the key of a session
+        :param is_session_active: callable returning True if a session plays audio and is not muted
+        :param device: 'headset' or 'speaker'
+        :param hear_through: True if hear through is enabled
+        :return: dict of controlled application -> (session, target volume) for the recomputed targets
+        """
+        if device != self.device:
+            self.device = device
+            self.dirty.update(self.rules)
+        if hear_through != self.hear_through:
+            self.hear_through = hear_through
+            self.dirty.update(self.watchers.get('hear_through', ()))
+
+        check_state = self.table.config['check_watched_application_state']
+        statuses = {}
+        for pattern, session in session_index.matches.items():
+            if pattern in self.watchers:
+                statuses[pattern] = (get_key(session), not check_state or is_session_active(session))
+            elif pattern in self.rules:
+                statuses[pattern] = (get_key(session), None)
+        self.changed_statuses = []
+        for pattern in statuses.keys() | self.statuses.keys():
+            if statuses.get(pattern) != self.statuses.get(pattern):
+                if pattern in self.watchers:
+                    self.dirty.update(self.watchers[pattern])
+                    self.changed_statuses.append(pattern)
+                if pattern in self.rules:
+                    self.dirty.add(pattern)
+        self.statuses = statuses
+
+        updates = {}
+        for application in self.dirty:
+            session = session_index.matches.get(application)
+            if session is None:
+                self.targets.pop(application, None)
+                self.causes.pop(application, None)
+                continue
+            target_volume, self.causes[application] = self.__resolve(application)
+            self.targets[application] = target_volume
+            updates[application] = (session, target_volume)
+        self.dirty = set()
+        return updates
+
+    def watched_sessions(self, session_index):
+        """
+        :param session_index: SessionIndex of the current sessions
+        :return: list of the sessions of all watched applications
+        """
+        return [session for pattern, session in session_index.matches.items() if pattern in self.watchers]
+
+    def __resolve(self, application):
+        """
+        :return: the lowest volume of all active watched applications, the standard volume if none is active,
+                 and the watched application it belongs to ('' for the standard volume)
+        """
+        if self.table.config['reset_volume_sessions']:
+            return 1, 'reset_volume_sessions'
+        standard, watched = self.rules[application]
+        standard_volume = standard[self.device]
+        target_volume = standard_volume
+        cause = ''
+        for name, volumes in watched:
+            if name == 'hear_through':
+                if not self.hear_through:
+                    continue
+            else:
+                status = self.statuses.get(name)
+                if status is None or not status[1] or not self.__is_profile_active(name):
+                    continue
+            # a standard volume of 0 mutes the application until one of the watched applications is active
+            if volumes[self.device] < target_volume or standard_volume == target_volume == 0:
+                target_volume = volumes[self.device]
+                cause = name
+        return target_volume, cause
+
+    def __is_profile_active(self, name):
+        """
+        :return: False if the watched application belongs to a group which is toggled off
+        """
+        return all(self.profiles[group] for group in self.groups.get(name, ()))
@@ -0,0 +1,261 @@
+"""
+    Binary traces of the inputs and decisions of the control loop, for replaying them without a sound server
+
+    A trace is a header followed by records, each starting with its kind and a timestamp:
+        N  string, gets the next string id, all names are stored once and referenced by id
+        P  contents of config.yaml and the profile files, written at the start and after every change
+        S  snapshot of the audio sessions (name, key, active, volume), written when it differs from the last one
+        D  name of the default output device, written when it changed
+        H  whether hear through is enabled, written when it changed
+        T  target volume per controlled application and the microphone gain, written after every evaluation
+"""
+import logging
+import math
+import os
+import struct
+import time
+
+from modules.audiosessions.sessionmatcher import get_session_name
+from modules.profiles.profilecompiler import thaw
+
+log = logging.getLogger("audiomanager")
+
+MAGIC = b'AMTRACE1'
+NONE = 0xFFFFFFFF
+
+RECORD = struct.Struct('<cd')
+COUNT = struct.Struct('<I')
+SESSION = struct.Struct('<IIBf')
+TARGET = struct.Struct('<If')
+GAIN = struct.Struct('<d')
+FLAG = struct.Struct('<B')
+
+
+class TraceWriter:
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.strings = {}
+
+    def close(self):
+        self.file.close()
+
+    def __string(self, value):
+        """
+        :return: id of the string, it is written first if it is new
+        """
+        if value is None:
+            return NONE
+        string_id = self.strings.get(value)
+        if string_id is None:
+            string_id = self.strings[value] = len(self.strings)
+            encoded = value.encode('utf-8')
+            self.file.write(RECORD.pack(b'N', 0) + COUNT.pack(len(encoded)) + encoded)
+        return string_id
+
+    def write_profiles(self, timestamp, files):
+        """
+        :param files: dict of file name -> contents
+        """
+        ids = [(self.__string(name), contents) for name, contents in files.items()]
+        self.file.write(RECORD.pack(b'P', timestamp) + COUNT.pack(len(ids)))
+        for name_id, contents in ids:
+            self.file.write(COUNT.pack(name_id) + COUNT.pack(len(contents)) + contents)
+
+    def write_sessions(self, timestamp, sessions):
+        """
+        :param sessions: tuple of (name, key, active, volume)
+        """
+        packed = [SESSION.pack(self.__string(name), self.__string(key), active, -1 if volume is None else volume)
+                  for name, key, active, volume in sessions]
+        self.file.write(RECORD.pack(b'S', timestamp) + COUNT.pack(len(packed)) + b''.join(packed))
+
+    def write_device(self, timestamp, output):
+        output_id = self.__string(output)
+        self.file.write(RECORD.pack(b'D', timestamp) + COUNT.pack(output_id))
+
+    def write_hear_through(self, timestamp, enabled):
+        self.file.write(RECORD.pack(b'H', timestamp) + FLAG.pack(enabled))
+
+    def write_targets(self, timestamp, targets, microphone_gain):
+        """
+        :param targets: dict of controlled application -> target volume
+        :param microphone_gain: resolved microphone gain or None
+        """
+        packed = [TARGET.pack(self.__string(application), volume) for application, volume in targets.items()]
+        self.file.write(RECORD.pack(b'T', timestamp) + COUNT.pack(len(packed)) + b''.join(packed) +
+                        GAIN.pack(math.nan if microphone_gain is None else microphone_gain))
+        self.file.flush()
+
+
+def read_trace(path):
+    """
+    :param path: trace file
+    :return: generator of (kind, timestamp, payload), kind is one of 'P', 'S', 'D', 'H' and 'T', an incomplete
+             last record (e.g. of a crashed process) ends it with a warning
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a trace")
+    strings = []
+    offset = len(MAGIC)
+
+    def read(layout):
+        nonlocal offset
+        if offset + layout.size > len(data):
+            raise EOFError
+        values = layout.unpack_from(data, offset)
+        offset += layout.size
+        return values
+
+    def take(length):
+        nonlocal offset
+        if offset + length > len(data):
+            raise EOFError
+        offset += length
+        return data[offset - length:offset]
+
+    def string(string_id):
+        return None if string_id == NONE else strings[string_id]
+
+    while offset < len(data):
+        start = offset
+        record = None
+        try:
+            kind, timestamp = read(RECORD)
+            kind = kind.decode('ascii')
+            if kind == 'N':
+                strings.append(take(read(COUNT)[0]).decode('utf-8'))
+            elif kind == 'P':
+                files = {}
+                for _ in range(read(COUNT)[0]):
+                    name_id, length = read(COUNT)[0], read(COUNT)[0]
+                    files[string(name_id)] = take(length)
+                record = kind, timestamp, files
+            elif kind == 'S':
+                sessions = []
+                for _ in range(read(COUNT)[0]):
+                    name_id, key_id, active, volume = read(SESSION)
+                    sessions.append((string(name_id), string(key_id), bool(active), None if volume < 0 else volume))
+                record = kind, timestamp, tuple(sessions)
+            elif kind == 'D':
+                record = kind, timestamp, string(read(COUNT)[0])
+            elif kind == 'H':
+                record = kind, timestamp, bool(read(FLAG)[0])
+            elif kind == 'T':
+                targets = {}
+                for _ in range(read(COUNT)[0]):
+                    application_id, volume = read(TARGET)
+                    targets[string(application_id)] = volume
+                microphone_gain, = read(GAIN)
+                record = kind, timestamp, (targets, None if math.isnan(microphone_gain) else microphone_gain)
+            else:
+                raise ValueError(f"Unknown record {kind} at {start} in {path}")
+        except EOFError:
+            # the process writing it ended in the middle of the record
+            log.warning(f"{path} ends in an incomplete record at {start}, reading the records before it")
+            return
+        if record is not None:
+            yield record
+
+
+class TraceRecorder:
+    def __init__(self, path, backend, compiler, clock=time.perf_counter):
+        """
+        :param path: trace file to write
+        :param backend: AudioBackend the sessions come from
+        :param compiler: ProfileCompiler of the config and profile files
+        :param clock: callable returning the current time in seconds
+        """
+        self.writer = TraceWriter(path)
+        self.backend = backend
+        self.compiler = compiler
+        self.clock = clock
+        self.started = clock()
+        # the replay groups the records of one call by their timestamp, so each call gets a later one
+        self.timestamp = -1.0
+        self.table = None
+        self.sessions = None
+        self.output = None
+        self.hear_through = False
+        # number of session snapshots written, the decisions are compared per snapshot
+        self.snapshots = 0
+
+    def close(self):
+        self.writer.close()
+
+    def record_inputs(self, profile_table, audio_sessions, default_output, hear_through):
+        """
+        writes the profile files, the sessions, the default output and hear through if they changed since the last call
+        :param profile_table: ProfileTable in use, its files are written when it is replaced
+        :param audio_sessions: iterable of the sessions as returned by the backend
+        :param default_output: name of the default output device
+        :param hear_through: True if hear through is enabled
+        :return:
+        """
+        self.timestamp = timestamp = max(self.clock() - self.started, math.nextafter(self.timestamp, math.inf))
+        if profile_table is not self.table:
+            import yaml
+            self.table = profile_table
+            # the config of the table, config.yaml is written some time after a toggle
+            files = {'config.yaml': yaml.dump(thaw(profile_table.config)).encode('utf-8')}
+            for path in self.compiler.files():
+                if path == self.compiler.config_path:
+                    continue
+                try:
+                    with open(path, 'rb') as file:
+                        files[f'profiles/{os.path.basename(path)}'] = file.read()
+                except OSError:
+                    pass
+            self.writer.write_profiles(timestamp, files)
+        if default_output != self.output:
+            self.output = default_output
+            self.writer.write_device(timestamp, default_output)
+        if hear_through != self.hear_through:
+            self.hear_through = hear_through
+            self.writer.write_hear_through(timestamp, hear_through)
+        sessions = tuple((get_session_name(audio_session), str(self.backend.get_session_key(audio_session)),
+                          self.backend.is_session_active(audio_session), self.backend.get_app_volume(audio_session))
+                         for audio_session in audio_sessions)
+        if sessions != self.sessions:
+            self.sessions = sessions
+            self.snapshots += 1
+            self.writer.write_sessions(timestamp, sessions)
+
+    def record_decisions(self, targets, microphone_gain):
+        """
+        :param targets: dict of controlled application -> target volume
+        :param microphone_gain: resolved microphone gain or None
+        :return:
+        """
+        self.writer.write_targets(self.clock() - self.started, targets, microphone_gain)
+
+
+def decisions(path):
+    """
+    :param path: trace file
+    :return: dict of session snapshot number -> (targets, microphone gain) in effect after it, snapshots
+             which were not evaluated (e.g. only the volumes changed) keep the previous decisions
+    """
+    snapshots = 0
+    result = {}
+    for kind, timestamp, payload in read_trace(path):
+        if kind == 'S':
+            snapshots += 1
+            result[snapshots] = result.get(snapshots - 1)
+        elif kind == 'T':
+            result[snapshots] = payload
+    return result
+
+
+def compare(expected_path, actual_path):
+    """
+    :param expected_path: recorded trace
+    :param actual_path: trace written while replaying it
+    :return: list of (snapshot number, expected, actual) for all snapshots with different decisions
+    """
+    expected, actual = decisions(expected_path), decisions(actual_path)
+    return [(snapshot, expected.get(snapshot), actual.get(snapshot))
+            for snapshot in sorted(expected.keys() | actual.keys())
+            if expected.get(snapshot) != actual.get(snapshot)]
@@ -0,0 +1,157 @@
+"""
+    Remembers the commanded volumes, so writes which would not change anything can be dropped, and the
+    volumes the sessions had before they were first changed, so they can be restored
+"""
+import logging
+import time
+from threading import Lock
+
+from modules.backends.audiobackend import VolumeWriteError
+from modules.metrics import metrics
+
+log = logging.getLogger("audiomanager")
+
+
+class VolumeCache:
+    def __init__(self, tolerance=.001, observe_tolerance=.01, device_refresh=30):
+        """
+        :param tolerance: writes closer than this to the commanded volume are dropped
+        :param observe_tolerance: read back volumes further away than this are external changes,
+                                  pactl only reports whole percents
+        :param device_refresh: seconds after which a device value is set again, device values
+                               can't be read back, so external changes are corrected this way
+        """
+        self.tolerance = tolerance
+        self.observe_tolerance = observe_tolerance
+        self.device_refresh = device_refresh
+        self.sessions = {}
+        # key -> volume of the session before the first transition
+        self.originals = {}
+        self.devices = {}
+        self.__lock = Lock()
+
+    def observe(self, key, volume):
+        """
+        compares a read back volume with the commanded one, forgets the commanded volume if
+        something else changed it
+        :param key: key of the session
+        :param volume: volume reported by the audio system
+        :return: the commanded volume if it is still valid, otherwise the reported volume
+        """
+        with self.__lock:
+            commanded = self.sessions.get(key)
+            if commanded is None:
+                return volume
+            if abs(commanded - volume) > self.observe_tolerance:
+                log.debug("Volume of %s changed externally to %s", key, volume)
+                del self.sessions[key]
+                return volume
+            return commanded
+
+    def filter_sessions(self, volumes):
+        """
+        :param volumes: dict key -> volume to write
+        :return: dict with only the volumes which differ from the commanded ones
+        """
+        with self.__lock:
+            return {key: volume for key, volume in volumes.items()
+                    if key not in self.sessions or abs(self.sessions[key] - volume) > self.tolerance}
+
+    def store_sessions(self, volumes):
+        with self.__lock:
+            self.sessions.update(volumes)
+
+    def forget_sessions(self, keys):
+        """
+        forgets sessions which are gone
+        :param keys: keys of the removed sessions
+        :return:
+        """
+        with self.__lock:
+            for key in keys:
+                self.sessions.pop(key, None)
+                self.originals.pop(key, None)
+
+    def remember_original(self, key, volume):
+        """
+        keeps the volume of a session before its first transition, later ones are ignored
+        :param key: key of the session
+        :param volume: volume of the session before the transition
+        :return:
+        """
+        with self.__lock:
+            self.originals.setdefault(key, volume)
+
+    def snapshot(self):
+        """
+        :return: copies of the commanded and the original volumes, dicts key -> volume
+        """
+        with self.__lock:
+            return dict(self.sessions), dict(self.originals)
+
+    def restore(self, sessions, originals):
+        """
+        takes over the commanded and original volumes of a previous run
+        :param sessions: dict key -> commanded volume
+        :param originals: dict key -> original volume
+        :return:
+        """
+        with self.__lock:
+            self.sessions.update(sessions)
+            self.originals.update(originals)
+
+    def device_changed(self, device, volume):
+        """
+        :param device: name of the device, e.g. 'microphone'
+        :param volume: volume or gain to set
+        :return: True if the value differs from the last one set or is due for a refresh,
+                 it is stored as the new one then
+        """
+        now = time.monotonic()
+        with self.__lock:
+            if device in self.devices:
+                commanded, commanded_at = self.devices[device]
+                if abs(commanded - volume) <= self.tolerance and now - commanded_at < self.device_refresh:
+                    return False
+            self.devices[device] = (volume, now)
+            return True
+
+
+class WriteCoalescer:
+    def __init__(self, cache, write_volumes, get_key):
+        """
+        :param cache: VolumeCache
+        :param write_volumes: callable setting a list of (session, volume) in one go
+        :param get_key: callable returning the key of a session
+        """
+        self.cache = cache
+        self.write_volumes = write_volumes
+        self.get_key = get_key
+
+    def write(self, volumes):
+        """
+        merges the writes of one tick per session (the last one wins), drops redundant ones and
+        writes the rest as one batch
+        :param volumes: list of (session, volume)
+        :return:
+        :raises VolumeWriteError: with all sessions of volumes whose volume could not be set, the others are stored
+        """
+        sessions = {}
+        targets = {}
+        for audio_session, volume in volumes:
+            key = self.get_key(audio_session)
+            sessions[key] = audio_session
+            targets[key] = volume
+        targets = self.cache.filter_sessions(targets)
+        metrics.volume_writes.inc('dropped', amount=len(volumes) - len(targets))
+        if not targets:
+            return
+        metrics.volume_writes.inc('sent', amount=len(targets))
+        try:
+            self.write_volumes([(sessions[key], volume) for key, volume in targets.items()])
+        except VolumeWriteError as err:
+            failed = {self.get_key(audio_session) for audio_session in err.sessions}
+            self.cache.store_sessions({key: volume for key, volume in targets.items() if key not in failed})
+            raise VolumeWriteError([audio_session for audio_session, volume in volumes
+                                    if self.get_key(audio_session) in failed]) from err
+        self.cache.store_sessions(targets)
@@ -1,4 +0,0 @@
-from webhooks import app as webhook_app
-
-if __name__ == "__main__":
-    app.run()
\ No newline at end of file